@@ -0,0 +1,142 @@
+import os
+import re
+import subprocess
+import sys
+
+from importlib import metadata
+
+try:
+    from packaging.requirements import InvalidRequirement, Requirement
+except ImportError:
+    Requirement = None
+
+PIP_CACHE_DIR = ".pip_cache"
+# Пакеты, которых нет в окружении, ставятся в каталог релиза;
+# лаунчер добавляет его в PYTHONPATH
+PACKAGES_DIR = ".packages"
+
+_REQUIREMENT_RE = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*)\s*(\[[^\]]*\])?\s*(.*)$")
+
+def normalize_name(name: str) -> str:
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+def get_installed_version(name: str, path: list[str] | None = None) -> str | None:
+    if path is not None:
+        # Первая найденная по пути копия - та, что будет импортирована
+        for distribution in metadata.distributions(name=name, path=path):
+            return distribution.version
+        return None
+
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+def is_satisfied(line: str, path: list[str] | None = None) -> bool:
+    if Requirement is not None:
+        try:
+            requirement = Requirement(line)
+        except InvalidRequirement:
+            return False
+
+        if requirement.url is not None:
+            return False
+        if requirement.marker is not None and not requirement.marker.evaluate():
+            return True
+
+        installed = get_installed_version(requirement.name, path)
+        return installed is not None and \
+            requirement.specifier.contains(installed, prereleases=True)
+
+    # Без packaging понимаем только имя без версии и точное "=="
+    match = _REQUIREMENT_RE.match(line)
+    if match is None:
+        return False
+
+    name, _, specifier = match.groups()
+    installed = get_installed_version(name, path)
+    if installed is None:
+        return False
+    if not specifier:
+        return True
+    if specifier.startswith("==") and "," not in specifier and ";" not in specifier:
+        return specifier[2:].strip() == installed
+
+    return False
+
+def read_requirements(req_file: str) -> tuple[list[str], list[str]]:
+    install_packages = list()
+    remove_packages = list()
+    with open(req_file, encoding="utf-8") as f:
+        for line in f:
+            line = line.split(" #", 1)[0].strip()
+            if not line or line.startswith("#"):
+                continue
+
+            if line.startswith('-'):
+                remove_packages.append(line[1:].strip())
+            else:
+                install_packages.append(line)
+
+    return install_packages, remove_packages
+
+def plan_changes(
+    install_packages: list[str],
+    remove_packages: list[str],
+    path: list[str] | None = None,
+    remove_path: list[str] | None = None
+) -> tuple[list[str], list[str]]:
+    to_install = [line for line in install_packages if not is_satisfied(line, path)]
+
+    wanted = set()
+    for line in install_packages:
+        match = _REQUIREMENT_RE.match(line)
+        if match is not None:
+            wanted.add(normalize_name(match.group(1)))
+
+    to_remove = [
+        name for name in remove_packages
+        if normalize_name(name) not in wanted and
+            get_installed_version(name, remove_path) is not None
+    ]
+    return to_install, to_remove
+
+def remove_from_target(name: str, target: str) -> None:
+    # pip uninstall не работает с --target: удаляем файлы по RECORD.
+    # Файлы в релизе - жёсткие ссылки, unlink не трогает другие релизы
+    for distribution in metadata.distributions(name=name, path=[target]):
+        for file in distribution.files or []:
+            path = os.path.normpath(str(distribution.locate_file(file)))
+            if path.startswith(os.path.normpath(target) + os.sep) and os.path.isfile(path):
+                os.remove(path)
+
+def reconcile_requirements(
+    req_file: str, cache_dir: str = PIP_CACHE_DIR, target: str | None = None
+) -> bool:
+    if target is None:
+        to_install, to_remove = plan_changes(*read_requirements(req_file))
+    else:
+        # Окружение не трогаем: недостающее ставится в target, удаляется только из него
+        target = os.path.abspath(target)
+        to_install, to_remove = plan_changes(
+            *read_requirements(req_file), [target] + sys.path, [target]
+        )
+
+    if to_remove:
+        if target is None:
+            subprocess.check_call(
+                [sys.executable, "-m", "pip", "uninstall", "-y"] + to_remove
+            )
+        else:
+            for name in to_remove:
+                remove_from_target(name, target)
+
+    if to_install:
+        command = [
+            sys.executable, "-m", "pip", "install", "--cache-dir", os.path.abspath(cache_dir)
+        ]
+        if target is not None:
+            command += ["--target", target, "--upgrade"]
+        subprocess.check_call(command + to_install)
+
+    return bool(to_install or to_remove)
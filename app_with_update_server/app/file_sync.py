@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from rate_limit import RateLimiter
+from retry import BUSY_STATUS_CODES, ServerBusy, get_retry_delay, parse_retry_after
+
+SYNC_STATE_FILE = ".sync_state.json"
+SYNC_BLOBS_DIR = ".sync_blobs"
+SYNC_TMP_EXT = ".sync_tmp"
+BLOB_WORKERS = 8
+HASH_CHUNK_SIZE = 1024 * 1024
+BLOB_TIMEOUT = (10, 60)
+BLOB_ATTEMPTS = 5
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+def is_safe_path(path: str) -> bool:
+    path = os.path.normpath(path)
+    return path != "." and not os.path.isabs(path) and not path.startswith("..")
+
+class FileSync():
+    def __init__(
+        self,
+        update_server_addr: str,
+        session: requests.Session,
+        root: str = ".",
+        rate_limiter: RateLimiter | None = None,
+        *,
+        wait: Callable[[float], bool | None] = time.sleep
+    ) -> None:
+        self.update_server_addr = update_server_addr
+        self.session = session
+        self.root = root
+        self.rate_limiter = rate_limiter
+        # wait(delay) возвращает True, если ожидание прервано остановкой
+        self.wait = wait
+
+    def sync(self, manifest: dict, previous_manifest: dict | None = None) -> bool:
+        files: dict[str, dict] = {
+            path: entry for path, entry in manifest["files"].items() if is_safe_path(path)
+        }
+        state = self.__load_state()
+        known_paths = set(state)
+        if previous_manifest is not None:
+            known_paths.update(previous_manifest["files"])
+
+        local_hashes = self.__hash_local_files(state, set(files) | known_paths)
+        available = {blob_hash: path for path, blob_hash in local_hashes.items()}
+
+        to_write = [
+            (path, entry) for path, entry in files.items()
+            if local_hashes.get(path) != entry["hash"]
+        ]
+        missing = {
+            entry["hash"] for _, entry in to_write if entry["hash"] not in available
+        }
+
+        blobs_dir = self.__path(SYNC_BLOBS_DIR)
+        os.makedirs(blobs_dir, exist_ok=True)
+        try:
+            with ThreadPoolExecutor(max_workers=BLOB_WORKERS) as executor:
+                results = list(executor.map(
+                    lambda blob_hash: self.__fetch_blob(blob_hash, blobs_dir), missing
+                ))
+            if not all(results):
+                return False
+
+            for blob_hash in missing:
+                available[blob_hash] = os.path.join(SYNC_BLOBS_DIR, blob_hash)
+
+            # Сначала готовим все файлы рядом, потом подменяем: источником
+            # может быть локальный файл, который сам будет перезаписан
+            staged = list()
+            for path, entry in to_write:
+                tmp_path = self.__path(path) + SYNC_TMP_EXT
+                os.makedirs(os.path.dirname(tmp_path) or ".", exist_ok=True)
+                shutil.copyfile(self.__path(available[entry["hash"]]), tmp_path)
+                os.chmod(tmp_path, entry.get("mode", 0o644) & 0o777)
+                staged.append((tmp_path, self.__path(path)))
+
+            for tmp_path, path in staged:
+                os.replace(tmp_path, path)
+        finally:
+            shutil.rmtree(blobs_dir, ignore_errors=True)
+
+        for path, target in manifest.get("links", dict()).items():
+            if not is_safe_path(path):
+                continue
+            link_path = self.__path(path)
+            if os.path.islink(link_path) and os.readlink(link_path) == target:
+                continue
+            if os.path.lexists(link_path):
+                os.remove(link_path)
+            os.symlink(target, link_path)
+
+        for path in sorted(known_paths - set(files), reverse=True):
+            if is_safe_path(path) and os.path.isfile(self.__path(path)):
+                os.remove(self.__path(path))
+                self.__remove_empty_dirs(os.path.dirname(os.path.normpath(path)))
+
+        self.__save_state(files)
+        return True
+
+    def __fetch_blob(self, blob_hash: str, blobs_dir: str) -> bool:
+        # Отказ сервера из-за нагрузки (503) - не ошибка: ждём Retry-After и повторяем
+        for attempt in range(BLOB_ATTEMPTS):
+            try:
+                return self.__fetch_blob_once(blob_hash, blobs_dir)
+            except ServerBusy as e:
+                if self.wait(get_retry_delay(attempt, e.retry_after)):
+                    return False
+
+        return False
+
+    def __fetch_blob_once(self, blob_hash: str, blobs_dir: str) -> bool:
+        blob_path = os.path.join(blobs_dir, blob_hash)
+        try:
+            with self.session.get(
+                f"{self.update_server_addr}/blob/{blob_hash}",
+                stream=True,
+                timeout=BLOB_TIMEOUT
+            ) as response:
+                if response.status_code in BUSY_STATUS_CODES:
+                    raise ServerBusy(parse_retry_after(response.headers.get("Retry-After")))
+                if not response.ok:
+                    return False
+
+                digest = hashlib.sha256()
+                with open(blob_path, "wb") as f:
+                    for chunk in response.iter_content(HASH_CHUNK_SIZE):
+                        if self.rate_limiter is not None:
+                            self.rate_limiter.consume(len(chunk))
+                        digest.update(chunk)
+                        f.write(chunk)
+        except requests.RequestException:
+            return False
+
+        return digest.hexdigest() == blob_hash
+
+    def __hash_local_files(self, state: dict, paths: set[str]) -> dict[str, str]:
+        hashes = dict()
+        for path in paths:
+            if not is_safe_path(path):
+                continue
+
+            try:
+                stat = os.stat(self.__path(path))
+            except OSError:
+                continue
+
+            cached = state.get(path)
+            if cached is not None and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+                hashes[path] = cached[2]
+            else:
+                hashes[path] = hash_file(self.__path(path))
+
+        return hashes
+
+    def __remove_empty_dirs(self, path: str) -> None:
+        while path:
+            try:
+                os.rmdir(self.__path(path))
+            except OSError:
+                return
+            path = os.path.dirname(path)
+
+    def __load_state(self) -> dict[str, list]:
+        state_path = self.__path(SYNC_STATE_FILE)
+        if not os.path.exists(state_path):
+            return dict()
+
+        with open(state_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def __save_state(self, files: dict[str, dict]) -> None:
+        state = dict()
+        for path, entry in files.items():
+            stat = os.stat(self.__path(path))
+            state[path] = [stat.st_size, stat.st_mtime_ns, entry["hash"]]
+
+        tmp_path = self.__path(SYNC_STATE_FILE) + SYNC_TMP_EXT
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.__path(SYNC_STATE_FILE))
+
+    def __path(self, path: str) -> str:
+        return os.path.join(self.root, path)
@@ -0,0 +1,56 @@
+import os
+import sys
+
+from dependencies import PACKAGES_DIR
+from releases import ReleaseStore
+from updater import LAUNCHER_SCRIPT, ROOT_STATE_FILES, VERSION_FILE
+
+# Точка входа установки: лаунчер лежит в корне, а приложение всегда
+# запускается из текущего релиза, рабочий каталог остаётся корнем
+ENTRY_SCRIPT = "test.py"
+ROOT_ENV = "UPDATER_ROOT"
+
+def read_root_version(root: str) -> str:
+    try:
+        with open(os.path.join(root, VERSION_FILE)) as f:
+            return f.read().strip() or "0"
+    except OSError:
+        return "0"
+
+def main() -> None:
+    root = os.environ.pop(ROOT_ENV, None)
+    delegated = root is not None
+    if root is None:
+        root = os.path.dirname(os.path.abspath(__file__))
+
+    releases = ReleaseStore(root)
+    releases.migrate_in_place(read_root_version(root), ROOT_STATE_FILES)
+    releases.apply_pending()
+
+    release_dir = releases.get_current_dir()
+    if release_dir is None:
+        raise SystemExit("Нет ни одного установленного релиза")
+
+    # Копия лаунчера в корне не обновляется: дальше работает лаунчер из релиза
+    release_launcher = os.path.join(release_dir, LAUNCHER_SCRIPT)
+    if not delegated and os.path.exists(release_launcher):
+        os.environ[ROOT_ENV] = root
+        os.execv(sys.executable, [sys.executable, release_launcher, *sys.argv[1:]])
+
+    # Пакеты, поставленные в сам релиз, важнее установленных в окружение;
+    # каталоги пакетов прежних релизов (остались после перезапуска) убираем
+    python_path = [
+        path for path in os.environ.get("PYTHONPATH", "").split(os.pathsep)
+        if path and not os.path.abspath(path).startswith(releases.releases_dir + os.sep)
+    ]
+    packages_dir = os.path.join(release_dir, PACKAGES_DIR)
+    if os.path.isdir(packages_dir):
+        python_path.insert(0, packages_dir)
+    os.environ["PYTHONPATH"] = os.pathsep.join(python_path)
+
+    os.chdir(root)
+    entry = os.path.join(release_dir, ENTRY_SCRIPT)
+    os.execv(sys.executable, [sys.executable, entry, *sys.argv[1:]])
+
+if __name__ == "__main__":
+    main()
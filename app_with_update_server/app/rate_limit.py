@@ -0,0 +1,26 @@
+import threading
+import time
+
+class RateLimiter():
+    def __init__(self, bytes_per_second: int) -> None:
+        if bytes_per_second <= 0:
+            raise ValueError("bytes_per_second must be positive")
+
+        self.bytes_per_second = bytes_per_second
+        self._allowance = float(bytes_per_second)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(
+                self.bytes_per_second,
+                self._allowance + (now - self._last) * self.bytes_per_second
+            )
+            self._last = now
+            self._allowance -= amount
+            delay = -self._allowance / self.bytes_per_second if self._allowance < 0 else 0
+
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,206 @@
+import os
+import shutil
+import tarfile
+
+RELEASES_DIR = "releases"
+CURRENT_LINK = "current"
+CURRENT_POINTER_FILE = "current.txt"
+PREVIOUS_POINTER_FILE = "previous.txt"
+PENDING_POINTER_FILE = "pending.txt"
+STAGING_PREFIX = ".staging-"
+
+def extract_tar(archive: tarfile.TarFile, root: str) -> None:
+    # Каталог релиза может содержать жёсткие ссылки на файлы предыдущего
+    # релиза: перед записью удаляем старый файл, а не перезаписываем inode
+    for member in archive:
+        path = os.path.normpath(member.name)
+        if os.path.isabs(path) or path.startswith(".."):
+            continue
+
+        target = os.path.join(root, path)
+        if not member.isdir() and (os.path.islink(target) or os.path.isfile(target)):
+            os.remove(target)
+
+        if hasattr(tarfile, "data_filter"):
+            archive.extract(member, root, filter="data")
+        else:
+            archive.extract(member, root)
+
+def link_tree(source: str, target: str, ignore=None) -> None:
+    try:
+        shutil.copytree(
+            source, target, symlinks=True, ignore=ignore, copy_function=os.link
+        )
+    except OSError:
+        # Файловая система без жёстких ссылок: копируем
+        shutil.rmtree(target, ignore_errors=True)
+        shutil.copytree(source, target, symlinks=True, ignore=ignore)
+
+class ReleaseStore():
+    def __init__(self, root: str = ".") -> None:
+        self.root = root
+        self.releases_dir = os.path.join(root, RELEASES_DIR)
+
+    def get_release_dir(self, version: str) -> str:
+        return os.path.join(self.releases_dir, version)
+
+    def has_release(self, version: str) -> bool:
+        return os.path.isdir(self.get_release_dir(version))
+
+    def get_current_dir(self) -> str | None:
+        link_path = os.path.join(self.root, CURRENT_LINK)
+        if os.path.islink(link_path):
+            return os.path.join(self.root, os.readlink(link_path))
+
+        name = self.__read_pointer(os.path.join(self.root, CURRENT_POINTER_FILE))
+        return self.get_release_dir(name) if name else None
+
+    def get_previous_dir(self) -> str | None:
+        name = self.__read_pointer(os.path.join(self.releases_dir, PREVIOUS_POINTER_FILE))
+        if not name or not self.has_release(name):
+            return None
+
+        return self.get_release_dir(name)
+
+    def get_pending_version(self) -> str | None:
+        name = self.__read_pointer(os.path.join(self.releases_dir, PENDING_POINTER_FILE))
+        if not name or not self.has_release(name):
+            return None
+
+        return name
+
+    def set_pending_version(self, version: str | None) -> None:
+        pending_path = os.path.join(self.releases_dir, PENDING_POINTER_FILE)
+        if version is None:
+            if os.path.exists(pending_path):
+                os.remove(pending_path)
+            return
+
+        self.__write_pointer(pending_path, version)
+
+    def create_staging(self, version: str, base_dir: str | None = None) -> str:
+        staging_dir = os.path.join(self.releases_dir, f"{STAGING_PREFIX}{version}")
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        os.makedirs(self.releases_dir, exist_ok=True)
+        if base_dir is not None and os.path.isdir(base_dir):
+            link_tree(base_dir, staging_dir)
+        else:
+            os.makedirs(staging_dir)
+
+        return staging_dir
+
+    def discard_staging(self, staging_dir: str) -> None:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def commit_staging(self, staging_dir: str, version: str) -> str:
+        release_dir = self.get_release_dir(version)
+        if os.path.isdir(release_dir):
+            shutil.rmtree(release_dir)
+        os.rename(staging_dir, release_dir)
+        return release_dir
+
+    def switch(self, release_dir: str) -> None:
+        current_dir = self.get_current_dir()
+        name = os.path.basename(os.path.normpath(release_dir))
+        relative_target = os.path.join(RELEASES_DIR, name)
+
+        link_path = os.path.join(self.root, CURRENT_LINK)
+        tmp_link = f"{link_path}.tmp"
+        try:
+            if os.path.lexists(tmp_link):
+                os.remove(tmp_link)
+            os.symlink(relative_target, tmp_link, target_is_directory=True)
+            os.replace(tmp_link, link_path)
+        except (OSError, NotImplementedError):
+            # Без прав на симлинки (Windows) указатель хранится в файле
+            self.__write_pointer(os.path.join(self.root, CURRENT_POINTER_FILE), name)
+
+        if current_dir is not None and os.path.normpath(current_dir) != \
+                os.path.normpath(release_dir):
+            self.__write_pointer(
+                os.path.join(self.releases_dir, PREVIOUS_POINTER_FILE),
+                os.path.basename(os.path.normpath(current_dir))
+            )
+
+    def activate(self, version: str) -> bool:
+        if not self.has_release(version):
+            return False
+
+        self.switch(self.get_release_dir(version))
+        # Явно включённая версия отменяет скачанную заранее, иначе при
+        # следующем запуске произошёл бы откат на неё
+        self.set_pending_version(None)
+        self.prune()
+        return True
+
+    def apply_pending(self) -> str | None:
+        version = self.get_pending_version()
+        if version is None:
+            return None
+
+        current_dir = self.get_current_dir()
+        if current_dir is not None and os.path.basename(os.path.normpath(current_dir)) == version:
+            self.set_pending_version(None)
+            return None
+
+        self.activate(version)
+        return version
+
+    def migrate_in_place(self, version: str, keep_in_root: tuple[str, ...] = ()) -> str | None:
+        # Установка старого образца распакована прямо в root: переносим её
+        # в releases/<version>, состояние установки (keep_in_root) не копируем
+        if self.get_current_dir() is not None:
+            return None
+
+        skip = {RELEASES_DIR, CURRENT_LINK, f"{CURRENT_LINK}.tmp", CURRENT_POINTER_FILE}
+        skip.update(keep_in_root)
+        root = os.path.normpath(self.root)
+
+        def ignore(directory: str, names: list[str]) -> list[str]:
+            if os.path.normpath(directory) != root:
+                return []
+            return [name for name in names if name in skip]
+
+        staging_dir = os.path.join(self.releases_dir, f"{STAGING_PREFIX}{version}")
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        os.makedirs(self.releases_dir, exist_ok=True)
+        try:
+            link_tree(self.root, staging_dir, ignore)
+            release_dir = self.commit_staging(staging_dir, version)
+        finally:
+            self.discard_staging(staging_dir)
+
+        self.switch(release_dir)
+        return release_dir
+
+    def prune(self, keep_dirs: list[str] | None = None) -> None:
+        if not os.path.isdir(self.releases_dir):
+            return
+
+        keep = {
+            os.path.normpath(path)
+            for path in [self.get_current_dir(), self.get_previous_dir()] + (keep_dirs or [])
+            if path
+        }
+        pending_version = self.get_pending_version()
+        if pending_version is not None:
+            keep.add(os.path.normpath(self.get_release_dir(pending_version)))
+        for name in os.listdir(self.releases_dir):
+            path = os.path.join(self.releases_dir, name)
+            if not os.path.isdir(path) or name.startswith(STAGING_PREFIX):
+                continue
+            if os.path.normpath(path) not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def __read_pointer(self, path: str) -> str | None:
+        if not os.path.exists(path):
+            return None
+
+        with open(path, encoding="utf-8") as f:
+            return f.read().strip() or None
+
+    def __write_pointer(self, path: str, value: str) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(value)
+        os.replace(tmp_path, path)
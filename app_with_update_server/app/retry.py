@@ -0,0 +1,34 @@
+import random
+import time
+
+from email.utils import parsedate_to_datetime
+
+RETRY_AFTER_MAX = 300
+BUSY_STATUS_CODES = (429, 503)
+
+def parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def get_retry_delay(attempt: int, retry_after: float | None = None) -> float:
+    delay = min(2 ** attempt, 30)
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, RETRY_AFTER_MAX))
+
+    # Разброс, чтобы клиенты после отказа не вернулись одновременно
+    return delay * random.uniform(1.0, 1.25)
+
+class ServerBusy(Exception):
+    def __init__(self, retry_after: float | None) -> None:
+        super().__init__(retry_after)
+        self.retry_after = retry_after
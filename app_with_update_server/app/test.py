@@ -1,5 +1,14 @@
 from updater import Updater
 
+# Запуск: python launcher.py. Рабочий каталог - корень установки,
+# сам этот файл работает из releases/<версия>
 updater = Updater("http://localhost:5000", "example_app")
-if updater.updates_available() and updater.update():
-    input("Нажмите Enter, чтобы закрыть программу")
+# Запущены из корня (установка старого образца) или скачана новая версия:
+# перезапускаемся через лаунчер, чтобы работал код из current/
+if updater.apply_pending() or not updater.is_running_current():
+    updater.relaunch()
+
+print(f"Запущена версия {updater.get_current_version()}")
+updater.start_prefetch(interval=3600, bandwidth_limit=1024 * 1024)
+input("Нажмите Enter, чтобы закрыть программу")
+updater.stop_prefetch(timeout=1)
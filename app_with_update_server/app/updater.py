@@ -1,122 +1,703 @@
+import hashlib
+import json
 import os
-import subprocess
-import shutil
+import random
 import sys
+import tarfile
+import threading
+import time
+import traceback
+import uuid
 import requests
 
+from typing import Callable
+
+from requests.adapters import HTTPAdapter
+
+from dependencies import PACKAGES_DIR, PIP_CACHE_DIR, reconcile_requirements
+from file_sync import BLOB_WORKERS, SYNC_STATE_FILE, FileSync
+from rate_limit import RateLimiter
+from releases import ReleaseStore, extract_tar
+from retry import BUSY_STATUS_CODES, ServerBusy, get_retry_delay, parse_retry_after
+
 VERSION_FILE = "version.txt"
 UPDATE_FILE_EXT = ".tar.gz"
+DELTA_FILE_EXT = ".delta.tar.gz"
+DELTA_MANIFEST = ".delta.json"
+VERSIONS_CACHE_FILE = ".versions_cache.json"
+VERSIONS_MEMO_TTL = 60
+VALIDATOR_FILE_EXT = ".validator"
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+DOWNLOAD_ATTEMPTS = 5
+DOWNLOAD_TIMEOUT = (10, 60)
+CLIENT_ID_FILE = ".client_id"
+CLIENT_ID_HEADER = "X-Client-Id"
+DOWNLOAD_DIR = ".downloads"
+LAUNCHER_SCRIPT = "launcher.py"
+# Состояние установки в корне: общее для всех релизов и не входит в них
+ROOT_STATE_FILES = (CLIENT_ID_FILE, VERSIONS_CACHE_FILE, DOWNLOAD_DIR, PIP_CACHE_DIR)
+
+def parse_version_key(version: str) -> tuple[int, ...]:
+    version = version.strip()
+    if not version:
+        return ()
+
+    key = list(map(int, version.split('.')))
+    while key and key[-1] == 0:
+        key.pop()
+
+    return tuple(key)
 
 class Version(str):
+    key: tuple[int, ...]
+
+    def __new__(cls, value: str = "") -> "Version":
+        if isinstance(value, Version):
+            return value
+
+        version = super().__new__(cls, value.strip())
+        version.key = parse_version_key(version)
+        return version
+
     def __lt__(self, value: str) -> bool:
-        if not self.strip():
-            return True
-        if not value.strip():
+        return self.key < Version(value).key
+
+    def __le__(self, value: str) -> bool:
+        return self.key <= Version(value).key
+
+    def __gt__(self, value: str) -> bool:
+        return self.key > Version(value).key
+
+    def __ge__(self, value: str) -> bool:
+        return self.key >= Version(value).key
+
+    # Равенство и хеш тоже по ключу: "1.0" и "1" - одна и та же версия.
+    # Поэтому словари с ключами Version нужно спрашивать через Version
+    def __eq__(self, value: object) -> bool:
+        if not isinstance(value, str):
+            return NotImplemented
+        try:
+            return self.key == Version(value).key
+        except ValueError:
             return False
 
-        v1 = list(map(int, self.split('.')))
-        v2 = list(map(int, value.split('.')))
+    def __ne__(self, value: object) -> bool:
+        result = self.__eq__(value)
+        return result if result is NotImplemented else not result
 
-        while len(v1) < len(v2):
-            v1.append(0)
-        while len(v2) < len(v1):
-            v2.append(0)
+    def __hash__(self) -> int:
+        return hash(self.key)
 
-        for a, b in zip(v1, v2):
-            if a < b:
-                return True
-            if a > b:
-                return False
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
 
-        return False
+def get_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=BLOB_WORKERS)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+
+        return _session
+
+def load_client_id(path: str) -> str:
+    # Постоянный идентификатор установки: по нему сервер решает,
+    # попадает ли клиент в поэтапный выкат версии
+    try:
+        with open(path, encoding="utf-8") as f:
+            client_id = f.read().strip()
+        if client_id:
+            return client_id
+    except OSError:
+        pass
+
+    client_id = uuid.uuid4().hex
+    try:
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            f.write(client_id)
+        os.replace(f"{path}.tmp", path)
+    except OSError:
+        pass
+
+    return client_id
+
+def check_updates(updaters: list["Updater"]) -> list["Updater"]:
+    by_server: dict[str, list[Updater]] = dict()
+    for updater in updaters:
+        by_server.setdefault(updater.update_server_addr, list()).append(updater)
+
+    outdated = list()
+    for server_addr, server_updaters in by_server.items():
+        try:
+            response = get_session().get(f"{server_addr}/versions/batch", params={
+                "apps": [updater.app_name for updater in server_updaters]
+            }, headers={
+                CLIENT_ID_HEADER: server_updaters[0].client_id
+            }, timeout=DOWNLOAD_TIMEOUT)
+        except requests.RequestException:
+            continue
+        if not response.ok:
+            continue
+
+        last_versions = response.json()
+        for updater in server_updaters:
+            last_version = last_versions.get(updater.app_name)
+            if last_version is not None and \
+                    updater.get_current_version() < Version(last_version):
+                outdated.append(updater)
+
+    return outdated
+
+class _HashingReader():
+    def __init__(self, raw, rate_limiter: RateLimiter | None = None) -> None:
+        self._raw = raw
+        self._rate_limiter = rate_limiter
+        self.digest = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._raw.read(size)
+        if self._rate_limiter is not None:
+            self._rate_limiter.consume(len(data))
+        self.digest.update(data)
+        return data
 
 class Updater():
-    def __init__(self, update_server_addr: str, app_name: str) -> None:
+    def __init__(self, update_server_addr: str, app_name: str, root: str = ".") -> None:
         self.update_server_addr = update_server_addr
         self.app_name = app_name
+        self.root = root
+        self.session = get_session()
+        self.releases = ReleaseStore(root)
+        self.client_id = load_client_id(os.path.join(root, CLIENT_ID_FILE))
+        self._versions: dict | None = None
+        self._versions_time = 0.0
+        self._install_lock = threading.RLock()
+        self._prefetch_thread: threading.Thread | None = None
+        self._prefetch_stop = threading.Event()
+        self._prefetch_limiter: RateLimiter | None = None
+
+    def get_current_release_dir(self) -> str | None:
+        return self.releases.get_current_dir()
 
     def get_current_version(self) -> Version:
-        if not os.path.exists(VERSION_FILE):
+        release_dir = self.get_current_release_dir()
+        version_file = os.path.join(self.root, VERSION_FILE)
+        if release_dir is not None:
+            version_file = os.path.join(release_dir, VERSION_FILE)
+
+        if not os.path.exists(version_file):
             return Version("0")
 
-        with open(VERSION_FILE) as f:
+        with open(version_file) as f:
             return Version(f.read())
 
-    def get_last_version_from_server(self) -> Version | None:
-        response = requests.get(f"{self.update_server_addr}/versions", params={
+    def get_versions_from_server(self, refresh: bool = False) -> dict | None:
+        # updates_available() и update() в одной проверке делят один ответ
+        if not refresh and self._versions is not None and \
+                time.monotonic() - self._versions_time < VERSIONS_MEMO_TTL:
+            return self._versions
+
+        cache = self.__load_versions_cache()
+        headers = {CLIENT_ID_HEADER: self.client_id}
+        if cache is not None:
+            headers["If-None-Match"] = cache["etag"]
+
+        response = self.session.get(f"{self.update_server_addr}/versions", params={
             "app": self.app_name
-        })
-        if not response.ok:
+        }, headers=headers, timeout=DOWNLOAD_TIMEOUT)
+        if response.status_code == 304 and cache is not None:
+            results = cache["body"]
+        elif not response.ok:
+            return None
+        else:
+            results = response.json()
+            etag = response.headers.get("ETag")
+            if etag:
+                self.__save_versions_cache(etag, results)
+
+        self._versions = results
+        self._versions_time = time.monotonic()
+        return results
+
+    def get_last_version_from_server(self) -> Version | None:
+        results = self.get_versions_from_server()
+        if results is None:
             return None
 
-        results = response.json()
         return Version(results["last_version"])
 
     def download_version(self, version: str) -> str | None:
-        response = requests.get(f"{self.update_server_addr}/get_version", params={
+        return self.__download("get_version", {
             "app": self.app_name,
             "version": version
-        })
+        }, f"{version}{UPDATE_FILE_EXT}")
 
-        if not response.ok:
-            return None
+    def download_delta(self, from_version: str, version: str) -> str | None:
+        return self.__download("get_delta", {
+            "app": self.app_name,
+            "from_version": from_version,
+            "version": version
+        }, f"{from_version}-{version}{DELTA_FILE_EXT}")
 
-        tmp_folder = "/tmp" if os.path.exists("/tmp") else "tmp"
+    def apply_delta(self, delta_path: str, root: str = ".") -> None:
+        with tarfile.open(delta_path, "r:gz") as archive:
+            extract_tar(archive, root)
 
-        file_path = f"{tmp_folder}/{version}{UPDATE_FILE_EXT}"
-        with open(file_path, "wb") as f:
-            f.write(response.content)
+        manifest_path = os.path.join(root, DELTA_MANIFEST)
+        if not os.path.exists(manifest_path):
+            return
 
-        return file_path
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        os.remove(manifest_path)
 
-    def update(self, version: str | None = None) -> bool:
+        for name in manifest["removed"]:
+            path = os.path.normpath(name)
+            if os.path.isabs(path) or path.startswith(".."):
+                continue
+
+            path = os.path.join(root, path)
+            if os.path.islink(path) or os.path.isfile(path):
+                os.remove(path)
+            elif os.path.isdir(path) and not os.listdir(path):
+                os.rmdir(path)
+
+    def sync_version(self, version: str, root: str = ".") -> bool:
+        manifest = self.__get_manifest(version)
+        if manifest is None:
+            return False
+
+        previous_manifest = None
+        if not os.path.exists(os.path.join(root, SYNC_STATE_FILE)):
+            previous_manifest = self.__get_manifest(self.get_current_version())
+
+        file_sync = FileSync(
+            self.update_server_addr,
+            self.session,
+            root,
+            self.__get_rate_limiter(),
+            wait=self.__get_wait()
+        )
+        return file_sync.sync(manifest, previous_manifest)
+
+    def prepare_version(self, version: str | None = None) -> str | None:
+        with self._install_lock:
+            return self.__prepare_version(version)
+
+    def __prepare_version(self, version: str | None) -> str | None:
+        versions = self.get_versions_from_server()
         if version is None:
-            version = self.get_last_version_from_server()
+            if versions is None:
+                return None
+            version = Version(versions["last_version"])
+        version = Version(version)
+
+        if self.releases.has_release(version):
+            return self.releases.get_release_dir(version)
+
+        # Новая версия собирается рядом с текущей и не трогает работающую
+        base_dir = self.get_current_release_dir()
+        staging_dir = None
+        try:
+            if base_dir is not None:
+                self.__print(f"Синхронизируем файлы версии {version}")
+                staging_dir = self.releases.create_staging(version, base_dir)
+                if self.sync_version(version, staging_dir):
+                    return self.__commit(staging_dir, version)
+
+                delta_chain = None
+                if versions is not None:
+                    delta_chain = self.__get_delta_chain(
+                        versions["versions"], self.get_current_version(), version
+                    )
+                if delta_chain:
+                    staging_dir = self.releases.create_staging(version, base_dir)
+                    if self.__apply_deltas(delta_chain, staging_dir):
+                        return self.__commit(staging_dir, version)
+
+            self.__print(f"Скачиваем версию {version}")
+            staging_dir = self.releases.create_staging(version)
+            if self.__stream_extract(version, staging_dir):
+                return self.__commit(staging_dir, version)
+
+            staging_dir = self.releases.create_staging(version)
+            tar_path = self.download_version(version)
+            if tar_path is None:
+                return None
+
+            with tarfile.open(tar_path, "r:gz") as archive:
+                extract_tar(archive, staging_dir)
+            os.remove(tar_path)
+            return self.__commit(staging_dir, version)
+        finally:
+            if staging_dir is not None:
+                self.releases.discard_staging(staging_dir)
+
+    def activate_version(self, version: str) -> bool:
+        # Зависимости уже поставлены при подготовке релиза: только переключаем
+        with self._install_lock:
+            return self.releases.activate(version)
+
+    def apply_pending(self) -> bool:
+        # Вызывать при старте или когда приложение простаивает. Новая версия
+        # начнёт работать только после relaunch()
+        with self._install_lock:
+            version = self.releases.get_pending_version()
             if version is None:
                 return False
+            if Version(version) <= self.get_current_version():
+                self.releases.set_pending_version(None)
+                return False
 
-        self.__print(f"Скачиваем версию {version}")
-        tar_path = self.download_version(version)
-        if tar_path is None:
-            self.__print("Не удалось скачать обновление :(")
+            self.activate_version(version)
+
+        self.__print(f"Версия {version} установлена!")
+        return True
+
+    def is_running_current(self) -> bool:
+        release_dir = self.get_current_release_dir()
+        if release_dir is None:
             return False
 
-        shutil.unpack_archive(tar_path, ".")
-        req_file = "requirements.txt"
-        if os.path.exists(req_file):
-            install_packages = list()
-            remove_packages = list()
-            with open(req_file, encoding="utf-8") as f:
-                for line in f:
-                    if line.startswith('-'):
-                        remove_packages.append(line[1:])
-                    else:
-                        install_packages.append(line)
-
-            if len(remove_packages):
-                subprocess.check_call(
-                    [sys.executable, "-m", "pip", "uninstall", "-y"] + remove_packages
-                )
-
-            if len(install_packages):
-                subprocess.check_call(
-                    [sys.executable, "-m", "pip", "install"] + install_packages
-                )
-
-            os.remove(req_file)
-
-        with open(VERSION_FILE, "w") as f:
-            f.write(version)
+        script_dir = os.path.dirname(os.path.realpath(sys.argv[0]))
+        return script_dir == os.path.realpath(release_dir)
+
+    def relaunch(self) -> None:
+        # Лаунчер применит скачанную версию и запустит приложение из current/
+        launcher = os.path.join(os.path.abspath(self.root), LAUNCHER_SCRIPT)
+        os.execv(sys.executable, [sys.executable, launcher, *sys.argv[1:]])
+
+    def start_prefetch(
+        self,
+        interval: float = 3600,
+        jitter: float = 0.2,
+        bandwidth_limit: int | None = None
+    ) -> None:
+        if self._prefetch_thread is not None and self._prefetch_thread.is_alive():
+            return
 
+        self._prefetch_limiter = RateLimiter(bandwidth_limit) if bandwidth_limit else None
+        self._prefetch_stop.clear()
+        self._prefetch_thread = threading.Thread(
+            target=self.__prefetch_loop,
+            args=(interval, jitter),
+            name=f"updater-prefetch-{self.app_name}",
+            daemon=True
+        )
+        self._prefetch_thread.start()
+
+    def stop_prefetch(self, timeout: float | None = None) -> None:
+        self._prefetch_stop.set()
+        if self._prefetch_thread is not None:
+            self._prefetch_thread.join(timeout)
+            self._prefetch_thread = None
+
+    def prefetch(self) -> str | None:
+        if not self.updates_available(refresh=True):
+            return None
+
+        release_dir = self.prepare_version()
+        if release_dir is None:
+            return None
+
+        version = os.path.basename(release_dir)
+        self.releases.set_pending_version(version)
+        return version
+
+    def update(self, version: str | None = None) -> bool:
+        release_dir = self.prepare_version(version)
+        if release_dir is None:
+            self.__print("Не удалось скачать обновление :(")
+            return False
+
+        version = os.path.basename(release_dir)
+        self.activate_version(version)
         self.__print(f"Версия {version} установлена!")
         return True
 
-    def updates_available(self) -> bool:
+    def rollback(self) -> bool:
+        previous_dir = self.releases.get_previous_dir()
+        if previous_dir is None:
+            return False
+
+        self.releases.switch(previous_dir)
+        self.__print(f"Возврат к версии {os.path.basename(previous_dir)}")
+        return True
+
+    def updates_available(self, refresh: bool = False) -> bool:
         current_version = self.get_current_version()
-        last_version = self.get_last_version_from_server()
-        return last_version is not None and current_version < last_version
+        results = self.get_versions_from_server(refresh)
+        if results is None:
+            return False
+
+        return current_version < Version(results["last_version"])
+
+    def __prefetch_loop(self, interval: float, jitter: float) -> None:
+        # Первую проверку тоже сдвигаем, чтобы клиенты не пришли все разом
+        delay = random.uniform(0, interval * jitter)
+        while not self._prefetch_stop.wait(delay):
+            try:
+                self.prefetch()
+            except Exception:
+                # Фоновая проверка не должна ронять приложение, но и молчать тоже
+                print(f"Не удалось подготовить обновление {self.app_name}:", file=sys.stderr)
+                traceback.print_exc()
+
+            delay = interval * random.uniform(1 - jitter, 1 + jitter)
+
+    def __get_rate_limiter(self) -> RateLimiter | None:
+        if threading.current_thread() is self._prefetch_thread:
+            return self._prefetch_limiter
+
+        return None
+
+    def __commit(self, staging_dir: str, version: str) -> str:
+        # Через os.replace: старый version.txt может быть жёсткой ссылкой
+        version_file = os.path.join(staging_dir, VERSION_FILE)
+        with open(f"{version_file}.tmp", "w") as f:
+            f.write(version)
+        os.replace(f"{version_file}.tmp", version_file)
+
+        # Зависимости ставятся здесь, в фоне, а не при запуске новой версии
+        self.__install_requirements(staging_dir)
+        return self.releases.commit_staging(staging_dir, version)
+
+    def __stream_extract(self, version: str, staging_dir: str) -> bool:
+        for attempt in range(DOWNLOAD_ATTEMPTS):
+            try:
+                return self.__stream_extract_once(version, staging_dir)
+            except ServerBusy as e:
+                self.__print(f"Сервер занят, повторим загрузку {version} позже")
+                self.__sleep(get_retry_delay(attempt, e.retry_after))
+
+        return False
+
+    def __stream_extract_once(self, version: str, staging_dir: str) -> bool:
+        # Распаковываем прямо из HTTP-потока, без промежуточного файла
+        try:
+            with self.session.get(f"{self.update_server_addr}/get_version", params={
+                "app": self.app_name,
+                "version": version
+            }, headers={
+                CLIENT_ID_HEADER: self.client_id
+            }, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status_code in BUSY_STATUS_CODES:
+                    raise ServerBusy(parse_retry_after(response.headers.get("Retry-After")))
+                if not response.ok:
+                    return False
+
+                reader = _HashingReader(response.raw, self.__get_rate_limiter())
+                with tarfile.open(fileobj=reader, mode="r|gz") as archive:
+                    extract_tar(archive, staging_dir)
+                while reader.read(DOWNLOAD_CHUNK_SIZE):
+                    pass
+
+                etag = response.headers.get("ETag", "").strip('"')
+        except (requests.RequestException, tarfile.TarError, OSError, EOFError):
+            return False
+
+        if len(etag) == 64 and etag != reader.digest.hexdigest():
+            return False
+
+        return True
+
+    def __get_delta_chain(
+        self, server_versions: list[str], current_version: Version, version: Version
+    ) -> list[tuple[str, str]] | None:
+        ascending = sorted(map(Version, server_versions), key=lambda v: v.key)
+        keys = [v.key for v in ascending]
+        if current_version.key not in keys or version.key not in keys:
+            return None
+
+        start = keys.index(current_version.key)
+        end = keys.index(version.key)
+        if start >= end:
+            return None
+
+        return list(zip(ascending[start:end], ascending[start + 1:end + 1]))
+
+    def __apply_deltas(self, delta_chain: list[tuple[str, str]], root: str) -> bool:
+        for from_version, version in delta_chain:
+            self.__print(f"Скачиваем изменения {from_version} -> {version}")
+            delta_path = self.download_delta(from_version, version)
+            if delta_path is None:
+                return False
+
+            self.apply_delta(delta_path, root)
+            os.remove(delta_path)
+
+        return True
+
+    def __get_manifest(self, version: str) -> dict | None:
+        for attempt in range(DOWNLOAD_ATTEMPTS):
+            try:
+                response = self.session.get(f"{self.update_server_addr}/manifest", params={
+                    "app": self.app_name,
+                    "version": version
+                }, headers={
+                    CLIENT_ID_HEADER: self.client_id
+                }, timeout=DOWNLOAD_TIMEOUT)
+            except requests.RequestException:
+                return None
+
+            if response.status_code not in BUSY_STATUS_CODES:
+                break
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            self.__sleep(get_retry_delay(attempt, retry_after))
+        else:
+            return None
+
+        if not response.ok:
+            return None
+
+        try:
+            return response.json()
+        except ValueError:
+            # Повреждённый манифест: обновимся полным архивом
+            return None
+
+    def __download(self, endpoint: str, params: dict, file_name: str) -> str | None:
+        tmp_folder = os.path.join(self.root, DOWNLOAD_DIR)
+        os.makedirs(tmp_folder, exist_ok=True)
+
+        file_path = os.path.join(tmp_folder, f"{self.app_name}-{file_name}")
+        part_path = f"{file_path}.part"
+        for attempt in range(DOWNLOAD_ATTEMPTS):
+            retry_after = None
+            try:
+                completed = self.__download_part(endpoint, params, part_path)
+            except (
+                requests.ConnectionError,
+                requests.Timeout,
+                requests.exceptions.ChunkedEncodingError
+            ):
+                completed = False
+            except ServerBusy as e:
+                completed = False
+                retry_after = e.retry_after
+
+            if completed is None:
+                return None
+            if completed:
+                os.replace(part_path, file_path)
+                self.__remove_file(f"{part_path}{VALIDATOR_FILE_EXT}")
+                return file_path
+
+            self.__sleep(get_retry_delay(attempt, retry_after))
+
+        return None
+
+    def __download_part(self, endpoint: str, params: dict, part_path: str) -> bool | None:
+        validator_path = f"{part_path}{VALIDATOR_FILE_EXT}"
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        validator = None
+        if offset and os.path.exists(validator_path):
+            with open(validator_path, encoding="utf-8") as f:
+                validator = f.read()
+
+        headers = {CLIENT_ID_HEADER: self.client_id}
+        if validator:
+            # If-Range: если файл на сервере сменился, придёт весь файл с кодом 200
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+
+        with self.session.get(
+            f"{self.update_server_addr}/{endpoint}",
+            params=params,
+            headers=headers,
+            stream=True,
+            timeout=DOWNLOAD_TIMEOUT
+        ) as response:
+            if response.status_code in BUSY_STATUS_CODES:
+                raise ServerBusy(parse_retry_after(response.headers.get("Retry-After")))
+            if response.status_code == 416:
+                if response.headers.get("Content-Range") == f"bytes */{offset}":
+                    return True
+                self.__remove_file(part_path)
+                return False
+
+            if not response.ok:
+                return None
+
+            if response.status_code == 206:
+                mode = "ab"
+            else:
+                mode = "wb"
+                validator = response.headers.get("ETag") or \
+                    response.headers.get("Last-Modified")
+                if validator:
+                    with open(validator_path, "w", encoding="utf-8") as f:
+                        f.write(validator)
+                else:
+                    self.__remove_file(validator_path)
+
+            rate_limiter = self.__get_rate_limiter()
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    if rate_limiter is not None:
+                        rate_limiter.consume(len(chunk))
+                    f.write(chunk)
+
+        return True
+
+    def __sleep(self, delay: float) -> None:
+        self.__get_wait()(delay)
+
+    def __get_wait(self) -> Callable[[float], bool | None]:
+        # Фоновую загрузку можно остановить и во время ожидания
+        if threading.current_thread() is self._prefetch_thread:
+            return self._prefetch_stop.wait
+
+        return time.sleep
+
+    def __remove_file(self, path: str) -> None:
+        if os.path.exists(path):
+            os.remove(path)
+
+    def __install_requirements(self, release_dir: str) -> None:
+        req_file = os.path.join(release_dir, "requirements.txt")
+        if os.path.exists(req_file):
+            reconcile_requirements(
+                req_file,
+                os.path.join(self.root, PIP_CACHE_DIR),
+                os.path.join(release_dir, PACKAGES_DIR)
+            )
+
+    def __load_versions_cache(self) -> dict | None:
+        cache_path = os.path.join(self.root, VERSIONS_CACHE_FILE)
+        if not os.path.exists(cache_path):
+            return None
+
+        try:
+            with open(cache_path, encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if cache.get("app") != self.app_name or cache.get("server") != self.update_server_addr:
+            return None
+
+        return cache
+
+    def __save_versions_cache(self, etag: str, body: dict) -> None:
+        cache_path = os.path.join(self.root, VERSIONS_CACHE_FILE)
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "app": self.app_name,
+                "server": self.update_server_addr,
+                "etag": etag,
+                "body": body
+            }, f)
+        os.replace(tmp_path, cache_path)
 
     def __print(self, text: str) -> None:
+        if threading.current_thread() is self._prefetch_thread:
+            return
+
         print("*"*80)
         print(f"{text:{' '}^80}")
         print("*"*80)
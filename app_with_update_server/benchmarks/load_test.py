@@ -0,0 +1,210 @@
+import argparse
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+
+UPDATE_SERVER_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "update_server")
+)
+
+def generate_updates(root: str, apps: int, versions: int, archive_size: int) -> list[str]:
+    app_names = list()
+    for app_index in range(apps):
+        app_name = f"app{app_index}"
+        app_dir = os.path.join(root, "updates", app_name)
+        os.makedirs(app_dir, exist_ok=True)
+        for version_index in range(versions):
+            payload = os.urandom(archive_size)
+            archive_path = os.path.join(app_dir, f"1.0.{version_index}.tar.gz")
+            with tarfile.open(archive_path, "w:gz", compresslevel=1) as archive:
+                info = tarfile.TarInfo("payload.bin")
+                info.size = len(payload)
+                archive.addfile(info, io.BytesIO(payload))
+        app_names.append(app_name)
+
+    return app_names
+
+def start_server(root: str, port: int, workers: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = UPDATE_SERVER_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--port", str(port),
+            "--workers", str(workers),
+            "--log-level", "warning",
+            "--no-access-log"
+        ],
+        cwd=root,
+        env=env
+    )
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/versions", params={"app": "app0"}, timeout=1)
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.2)
+
+    server.kill()
+    raise RuntimeError("update server did not start")
+
+def run_clients(
+    server_addr: str,
+    app_names: list[str],
+    threads: int,
+    duration: float,
+    download_ratio: float,
+    seed: int
+) -> dict[str, dict]:
+    results = {
+        "/versions": {"latencies": list(), "bytes": 0, "errors": 0},
+        "/get_version": {"latencies": list(), "bytes": 0, "errors": 0}
+    }
+    results_lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(client_seed: int) -> None:
+        rnd = random.Random(client_seed)
+        local = {
+            "/versions": {"latencies": list(), "bytes": 0, "errors": 0},
+            "/get_version": {"latencies": list(), "bytes": 0, "errors": 0}
+        }
+        with requests.Session() as session:
+            while time.monotonic() < deadline:
+                app_name = rnd.choice(app_names)
+                last_version = request(
+                    session, local["/versions"], f"{server_addr}/versions",
+                    {"app": app_name}
+                )
+                if last_version is None or rnd.random() >= download_ratio:
+                    continue
+
+                request(
+                    session, local["/get_version"], f"{server_addr}/get_version",
+                    {"app": app_name, "version": last_version}
+                )
+
+        with results_lock:
+            for endpoint, stats in local.items():
+                results[endpoint]["latencies"].extend(stats["latencies"])
+                results[endpoint]["bytes"] += stats["bytes"]
+                results[endpoint]["errors"] += stats["errors"]
+
+    workers = [
+        threading.Thread(target=client, args=(seed * 100_000 + index,))
+        for index in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    return results
+
+def request(session: requests.Session, stats: dict, url: str, params: dict) -> str | None:
+    start = time.perf_counter()
+    try:
+        response = session.get(url, params=params, stream=True, timeout=60)
+        keep_body = url.endswith("/versions")
+        chunks = list()
+        size = 0
+        for chunk in response.iter_content(1024 * 1024):
+            size += len(chunk)
+            if keep_body:
+                chunks.append(chunk)
+        ok = response.ok
+        body = json.loads(b"".join(chunks)) if ok and keep_body else None
+    except (requests.RequestException, ValueError):
+        stats["errors"] += 1
+        return None
+
+    stats["latencies"].append(time.perf_counter() - start)
+    stats["bytes"] += size
+    if not ok:
+        stats["errors"] += 1
+        return None
+
+    return body["last_version"] if body is not None else ""
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест сервера обновлений")
+    parser.add_argument("--apps", type=int, default=5)
+    parser.add_argument("--versions", type=int, default=20)
+    parser.add_argument("--archive-size", type=int, default=1024 * 1024)
+    parser.add_argument("--processes", type=int, default=max((os.cpu_count() or 2) // 2, 1))
+    parser.add_argument("--threads", type=int, default=16, help="клиентов на процесс")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--download-ratio", type=float, default=0.1)
+    parser.add_argument("--workers", type=int, default=1, help="воркеров uvicorn")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--server", help="адрес уже запущенного сервера")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        server = None
+        if args.server is None:
+            print(
+                f"Генерируем {args.apps} приложений по {args.versions} версий "
+                f"({args.archive_size} байт)"
+            )
+            app_names = generate_updates(root, args.apps, args.versions, args.archive_size)
+            server = start_server(root, args.port, args.workers)
+            server_addr = f"http://127.0.0.1:{args.port}"
+        else:
+            app_names = [f"app{index}" for index in range(args.apps)]
+            server_addr = args.server
+
+        try:
+            with ProcessPoolExecutor(max_workers=args.processes) as executor:
+                futures = [
+                    executor.submit(
+                        run_clients, server_addr, app_names, args.threads,
+                        args.duration, args.download_ratio, args.seed + index
+                    )
+                    for index in range(args.processes)
+                ]
+                parts = [future.result() for future in futures]
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    print(f"Клиентов: {args.processes * args.threads}, длительность: {args.duration} с")
+    print(f"{'endpoint':<14} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'MB/s':>9} {'errors':>7}")
+    for endpoint in ("/versions", "/get_version"):
+        latencies = [value for part in parts for value in part[endpoint]["latencies"]]
+        total_bytes = sum(part[endpoint]["bytes"] for part in parts)
+        errors = sum(part[endpoint]["errors"] for part in parts)
+        print(
+            f"{endpoint:<14} {len(latencies) / args.duration:>9.1f} "
+            f"{percentile(latencies, 0.50) * 1000:>9.2f} "
+            f"{percentile(latencies, 0.95) * 1000:>9.2f} "
+            f"{percentile(latencies, 0.99) * 1000:>9.2f} "
+            f"{total_bytes / args.duration / 1024 / 1024:>9.1f} "
+            f"{errors:>7}"
+        )
+
+if __name__ == "__main__":
+    main()
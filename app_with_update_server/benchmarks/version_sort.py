@@ -0,0 +1,102 @@
+import argparse
+import functools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "update_server"))
+
+from utils import Version, version_key
+
+MAX_PARTS = 4
+
+def pad_key(parts) -> tuple[int, ...]:
+    key = tuple(parts)
+    return key + (0,) * (MAX_PARTS - len(key))
+
+# compare_version из update_server/utils.py до перехода на Version, без изменений.
+# Короткие части дополняются нулями справа ("2" против "10" сравнивается
+# как 20 и 10), поэтому порядок у неё другой: сравнивается только время
+def legacy_compare_version(version1: str, version2: str) -> int:
+    if not version1.strip():
+        return -1
+    if not version2.strip():
+        return 1
+
+    v1 = version1.split('.')
+    v2 = version2.split('.')
+
+    while len(v1) < len(v2):
+        v1.append('0')
+    while len(v2) < len(v1):
+        v2.append('0')
+
+    for a, b in zip(v1, v2):
+        while len(a) < len(b):
+            a += '0'
+        while len(b) < len(a):
+            b += '0'
+
+        a, b = int(a), int(b)
+        if a < b:
+            return -1
+        if a > b:
+            return 1
+
+    return 0
+
+def generate_versions(count: int, seed: int) -> list[str]:
+    rnd = random.Random(seed)
+    versions = list()
+    for _ in range(count):
+        parts = rnd.randint(1, MAX_PARTS)
+        versions.append('.'.join(str(rnd.randint(0, 30)) for _ in range(parts)))
+
+    return versions
+
+def measure(name: str, func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    print(f"{name:<40} {best * 1000:10.1f} ms")
+    return best
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сортировка списка версий")
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    raw_versions = generate_versions(args.count, args.seed)
+    parsed_versions = [Version(v) for v in raw_versions]
+
+    # Порядок Version сверяем с числовыми частями, дополненными нулями до MAX_PARTS
+    expected = sorted(pad_key(map(int, v.split('.'))) for v in raw_versions)
+    if [pad_key(v.key) for v in sorted(parsed_versions, key=version_key)] != expected:
+        raise RuntimeError("Порядок сортировки не совпадает")
+
+    print(f"Версий: {args.count}")
+    legacy = measure(
+        "cmp_to_key(старый compare_version)",
+        lambda: sorted(raw_versions, key=functools.cmp_to_key(legacy_compare_version)),
+        args.repeat
+    )
+    measure(
+        "Version() + сортировка по key",
+        lambda: sorted((Version(v) for v in raw_versions), key=version_key),
+        args.repeat
+    )
+    cached = measure(
+        "сортировка готовых Version по key",
+        lambda: sorted(parsed_versions, key=version_key),
+        args.repeat
+    )
+    print(f"Ускорение на готовых ключах: x{legacy / cached:.1f}")
+
+if __name__ == "__main__":
+    main()
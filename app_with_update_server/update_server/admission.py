@@ -0,0 +1,38 @@
+import random
+import threading
+
+from utils import MAX_DOWNLOADS_PER_APP, RETRY_AFTER
+
+class AdmissionControl():
+    def __init__(
+        self, max_active: int = MAX_DOWNLOADS_PER_APP, retry_after: int = RETRY_AFTER
+    ) -> None:
+        self._max_active = max_active
+        self._retry_after = retry_after
+        self._active: dict[str, int] = dict()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, app: str) -> bool:
+        with self._lock:
+            active = self._active.get(app, 0)
+            if active >= self._max_active:
+                return False
+
+            self._active[app] = active + 1
+            return True
+
+    def release(self, app: str) -> None:
+        with self._lock:
+            active = self._active.get(app, 0) - 1
+            if active > 0:
+                self._active[app] = active
+            else:
+                self._active.pop(app, None)
+
+    def get_active(self) -> int:
+        with self._lock:
+            return sum(self._active.values())
+
+    def get_retry_after(self) -> int:
+        # Разброс, чтобы отказанные клиенты не вернулись одновременно
+        return random.randint(self._retry_after, self._retry_after * 2)
@@ -1,4 +1,9 @@
+import atexit
+import os
+import queue
 import sys
+import threading
+import time
 import traceback
 
 from datetime import datetime
@@ -12,6 +17,199 @@ class LogLevel(IntEnum):
     ERROR = 3
     CRITICAL = 4
 
+class _TimestampCache():
+    def __init__(self) -> None:
+        self._second = -1
+        self._formatted = ""
+
+    def now(self) -> str:
+        second = int(time.time())
+        if second != self._second:
+            self._formatted = datetime.fromtimestamp(second).strftime('%Y-%m-%d %H:%M:%S')
+            self._second = second
+
+        return self._formatted
+
+class _BatchFileWriter():
+    _STOP = object()
+    _REPORT_INTERVAL = 60.0
+
+    def __init__(
+        self,
+        filename: str,
+        filemode: str,
+        batch_size: int,
+        flush_interval: float,
+        max_bytes: int,
+        backup_count: int
+    ) -> None:
+        self._filename = filename
+        self._filemode = filemode
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_bytes = max_bytes
+        self._backup_count = backup_count
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._file = None
+        self._size = 0
+        self._file_lock = threading.Lock()
+        self._stopped = False
+        self._lost = 0
+        self._reported_at = 0.0
+        self._thread = threading.Thread(
+            target=self._run, name=f"log-writer-{filename}", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, text: str) -> None:
+        if self._stopped:
+            self._write_now([text])
+            return
+
+        self._queue.put(text)
+        if self._stopped:
+            # Поток успел остановиться: строка не должна остаться в очереди
+            self._drain()
+
+    def close(self) -> None:
+        self._stopped = True
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+        self._drain()
+        with self._file_lock:
+            if self._file is not None:
+                self._file.close()
+
+    def _run(self) -> None:
+        try:
+            self._loop()
+        except Exception as e:
+            self._report(e, 0)
+        finally:
+            # Без потока записи пишем сразу, иначе строки копились бы в памяти
+            self._stopped = True
+            self._drain()
+
+    def _loop(self) -> None:
+        batch = list()
+        deadline = time.monotonic() + self._flush_interval
+        running = True
+        while running:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                item = None
+
+            if item is self._STOP:
+                running = False
+            elif item is not None:
+                batch.append(item)
+                if len(batch) < self._batch_size and time.monotonic() < deadline:
+                    continue
+
+            if batch:
+                self._write_now(batch)
+                batch = list()
+            deadline = time.monotonic() + self._flush_interval
+
+    def _drain(self) -> None:
+        batch = list()
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not self._STOP:
+                batch.append(item)
+
+        if batch:
+            self._write_now(batch)
+
+    def _write_now(self, batch: list[str]) -> None:
+        with self._file_lock:
+            try:
+                self._write_batch(batch)
+            except OSError as e:
+                self._report(e, len(batch))
+
+    def _report(self, error: Exception, lost: int) -> None:
+        # Ошибки записи (например, нет места на диске) не роняют поток,
+        # но и не должны пропадать молча; сообщаем не чаще раза в минуту
+        self._lost += lost
+        now = time.monotonic()
+        if now - self._reported_at < self._REPORT_INTERVAL:
+            return
+
+        self._reported_at = now
+        print(
+            f"Logger: failed to write {self._filename}, "
+            f"{self._lost} lines lost: {error!r}",
+            file=sys.stderr
+        )
+        self._lost = 0
+
+    def _write_batch(self, batch: list[str]) -> None:
+        if self._file is None or self._file.closed:
+            self._open()
+
+        # Лимит в байтах на диске, а не в символах; файл меняем посреди
+        # пачки, как только следующая строка его превысит
+        chunk = list()
+        for line in batch:
+            line_bytes = len(line.encode(self._file.encoding, "replace"))
+            if self._max_bytes > 0 and self._size > 0 and \
+                    self._size + line_bytes > self._max_bytes:
+                self._file.write("".join(chunk))
+                chunk = list()
+                self._rotate()
+            chunk.append(line)
+            self._size += line_bytes
+
+        self._file.write("".join(chunk))
+        self._file.flush()
+
+    def _open(self) -> None:
+        self._file = open(self._filename, self._filemode)
+        self._size = self._file.seek(0, os.SEEK_END)
+        # Повторное открытие (после ошибки или остановки) не должно стирать файл
+        self._filemode = "a"
+
+    def _rotate(self) -> None:
+        self._file.close()
+        if self._backup_count > 0:
+            for index in range(self._backup_count - 1, 0, -1):
+                source = f"{self._filename}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self._filename}.{index + 1}")
+            os.replace(self._filename, f"{self._filename}.1")
+        else:
+            os.remove(self._filename)
+        self._open()
+
+_writers: dict[str, _BatchFileWriter] = dict()
+_writers_lock = threading.Lock()
+
+def _get_batch_writer(filename: str, filemode: str, **kwargs) -> _BatchFileWriter:
+    # Логгеры с одним файлом пишут через общий поток, иначе ротация разъедется
+    path = os.path.abspath(filename)
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _BatchFileWriter(filename, filemode, **kwargs)
+            _writers[path] = writer
+
+        return writer
+
+@atexit.register
+def shutdown_writers() -> None:
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+
+    for writer in writers:
+        writer.close()
+
 class Logger():
     def __init__(
         self,
@@ -19,32 +217,56 @@ class Logger():
         log_level: LogLevel = LogLevel.INFO,
         filename: str = None,
         filemode: str = None,
-        print_to_console: bool = False
+        print_to_console: bool = False,
+        *,
+        batched: bool = False,
+        batch_size: int = 256,
+        flush_interval: float = 1.0,
+        max_bytes: int = 0,
+        backup_count: int = 0
     ) -> None:
         self._name = name
         self._log_level = log_level
         self._filename = filename
         self._filemode = filemode
         self._print_to_console = print_to_console
+        self._batched = batched
+        self._writer_options = {
+            "batch_size": batch_size,
+            "flush_interval": flush_interval,
+            "max_bytes": max_bytes,
+            "backup_count": backup_count
+        }
+        self._writer: _BatchFileWriter | None = None
+        self._timestamps = _TimestampCache()
 
         if self._filename is not None and self._filemode is None:
             raise ValueError("filemode must be specified if filename is specified")
+        if self._batched and self._filename is not None:
+            self._writer = _get_batch_writer(
+                self._filename, self._filemode, **self._writer_options
+            )
 
         self.debug("Logger initialized")
 
-    def log(self, message: str, log_level: LogLevel) -> None:
+    def log(self, message: str, log_level: LogLevel, exc_text: str | None = None) -> None:
         if log_level < self._log_level:
             return
 
-        now_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        log_message = f"[{now_time} - {log_level.name}] {self._name}: {message}"
+        now_time = self._timestamps.now()
+        log_message = f"[{now_time} - {log_level.name}] {self._name}: {message}\n"
+        if exc_text is not None:
+            # Трейсбек пишем одной записью с сообщением, чтобы не перемешался
+            log_message += exc_text
 
-        if self._filename is not None:
+        if self._writer is not None:
+            self._writer.write(log_message)
+        elif self._filename is not None:
             with open(self._filename, self._filemode) as f:
-                f.write(log_message + "\n")
+                f.write(log_message)
 
         if self._print_to_console:
-            print(log_message)
+            print(log_message, end="")
 
     def debug(self, message: str) -> None:
         self.log(message, LogLevel.DEBUG)
@@ -56,26 +278,17 @@ class Logger():
         self.log(message, LogLevel.WARNING)
 
     def error(self, message: str, *, exc_info: bool = False) -> None:
-        self.log(message, LogLevel.ERROR)
-        if exc_info:
-            self.__output_exception()
+        self.log(message, LogLevel.ERROR, self.__format_exception() if exc_info else None)
 
     def critical(self, message: str, *, exc_info: bool = False) -> None:
-        self.log(message, LogLevel.CRITICAL)
-        if exc_info:
-            self.__output_exception()
+        self.log(message, LogLevel.CRITICAL, self.__format_exception() if exc_info else None)
 
-    def __output_exception(self) -> None:
+    def __format_exception(self) -> str | None:
         exc_info = sys.exc_info()
         if None in exc_info:
-            return
+            return None
 
-        if self._filename is not None:
-            with open(self._filename, self._filemode) as f:
-                traceback.print_exception(*exc_info, file=f)
-
-        if self._print_to_console:
-            traceback.print_exception(*exc_info, file=sys.stdout)
+        return "".join(traceback.format_exception(*exc_info))
 
     def get_level(self) -> LogLevel:
         return self._log_level
@@ -92,6 +305,14 @@ class Logger():
     def set_file(self, filename: str, filemode: str) -> None:
         self._filename = filename
         self._filemode = filemode
+        self._writer = None
+        if self._batched and self._filename is not None:
+            self._writer = _get_batch_writer(
+                self._filename, self._filemode, **self._writer_options
+            )
+
+    def is_batched(self) -> bool:
+        return self._batched
 
     def is_print_to_console_enabled(self) -> bool:
         return self._print_to_console
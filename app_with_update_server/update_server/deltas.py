@@ -0,0 +1,129 @@
+import hashlib
+import io
+import json
+import os
+import tarfile
+import tempfile
+
+from concurrent.futures import Executor
+
+from jobs import BackgroundJobs
+from release_index import AppReleases
+from utils import *
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+def _member_signature(member: tarfile.TarInfo, digest: bytes | None = None) -> tuple:
+    if member.isfile():
+        return ("file", digest, member.mode)
+    if member.issym() or member.islnk():
+        return ("link", member.linkname, member.mode)
+
+    return ("dir", None, member.mode)
+
+def _hash_member(archive: tarfile.TarFile, member: tarfile.TarInfo, copy_to=None) -> bytes:
+    digest = hashlib.sha256()
+    with archive.extractfile(member) as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            if copy_to is not None:
+                copy_to.write(chunk)
+
+    return digest.digest()
+
+def _read_signatures(archive_path: str) -> dict[str, tuple]:
+    signatures = dict()
+    with tarfile.open(archive_path, "r:gz") as archive:
+        for member in archive:
+            if member.isfile():
+                signatures[member.name] = _member_signature(
+                    member, _hash_member(archive, member)
+                )
+            elif member.isdir() or member.issym() or member.islnk():
+                signatures[member.name] = _member_signature(member)
+
+    return signatures
+
+def build_delta(app: str, from_version: str, version: str) -> str:
+    from_path = get_app_file_version_path(app, from_version)
+    to_path = get_app_file_version_path(app, version)
+    if from_path is None or to_path is None:
+        raise FileNotFoundError(f"{app}: no archive for {from_version} or {version}")
+
+    old_signatures = _read_signatures(from_path)
+
+    delta_path = make_app_delta_path(app, from_version, version)
+    os.makedirs(os.path.dirname(delta_path), exist_ok=True)
+    # Уникальное имя: дельту могут строить несколько процессов сервера
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(delta_path))
+    os.close(fd)
+
+    try:
+        new_names = set()
+        with tarfile.open(to_path, "r:gz") as archive, \
+                tarfile.open(tmp_path, "w:gz") as delta:
+            for member in archive:
+                if not (member.isfile() or member.isdir() or member.issym() or member.islnk()):
+                    continue
+
+                new_names.add(member.name)
+                old_signature = old_signatures.get(member.name)
+                if not member.isfile():
+                    if old_signature != _member_signature(member):
+                        delta.addfile(member)
+                    continue
+
+                with tempfile.SpooledTemporaryFile(COPY_CHUNK_SIZE) as content:
+                    digest = _hash_member(archive, member, copy_to=content)
+                    if old_signature == _member_signature(member, digest):
+                        continue
+
+                    content.seek(0)
+                    delta.addfile(member, content)
+
+            manifest = json.dumps({
+                "from_version": from_version,
+                "version": version,
+                "removed": sorted(set(old_signatures) - new_names, reverse=True)
+            }).encode("utf-8")
+            manifest_info = tarfile.TarInfo(DELTA_MANIFEST)
+            manifest_info.size = len(manifest)
+            delta.addfile(manifest_info, io.BytesIO(manifest))
+
+        os.replace(tmp_path, delta_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return delta_path
+
+def is_delta_fresh(app: str, from_version: str, version: str) -> bool:
+    try:
+        delta_mtime = os.stat(make_app_delta_path(app, from_version, version)).st_mtime_ns
+        for archive_version in (from_version, version):
+            archive_path = f"{UPDATE_DIR}/{app}/{archive_version}{UPDATE_FILE_EXT}"
+            if os.stat(archive_path).st_mtime_ns > delta_mtime:
+                return False
+    except OSError:
+        return False
+
+    return True
+
+class DeltaBuilder():
+    def __init__(self, max_workers: int = 1, executor: Executor | None = None) -> None:
+        self._jobs = BackgroundJobs("Deltas", max_workers, executor)
+
+    def schedule(self, releases: AppReleases) -> None:
+        # versions отсортированы по убыванию: строим дельты между соседними
+        ascending = releases.versions[::-1]
+        for from_version, version in zip(ascending, ascending[1:]):
+            if is_delta_fresh(releases.app, from_version, version):
+                continue
+
+            self._jobs.submit(
+                make_app_delta_path(releases.app, from_version, version),
+                build_delta, releases.app, from_version, version
+            )
+
+    def shutdown(self) -> None:
+        self._jobs.shutdown()
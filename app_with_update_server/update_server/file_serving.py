@@ -0,0 +1,245 @@
+import mmap
+import os
+import threading
+
+from typing import Callable
+
+from collections import OrderedDict
+from email.utils import formatdate
+
+import anyio
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from release_index import ArchiveInfo
+
+SEND_CHUNK_SIZE = 1024 * 1024
+
+class MmapCache():
+    def __init__(
+        self,
+        max_file_size: int = 16 * 1024 * 1024,
+        max_total_size: int = 512 * 1024 * 1024,
+        hot_hits: int = 2
+    ) -> None:
+        self._max_file_size = max_file_size
+        self._max_total_size = max_total_size
+        self._hot_hits = hot_hits
+        self._maps: OrderedDict[tuple, mmap.mmap] = OrderedDict()
+        self._hits: dict[tuple, int] = dict()
+        self._total_size = 0
+        self._lock = threading.Lock()
+
+    def get(self, archive: ArchiveInfo) -> mmap.mmap | None:
+        key = (archive.path, archive.size, archive.mtime)
+        with self._lock:
+            cached = self._maps.get(key)
+            if cached is not None:
+                self._maps.move_to_end(key)
+            return cached
+
+    def is_hot(self, archive: ArchiveInfo) -> bool:
+        if archive.size == 0 or archive.size > self._max_file_size:
+            return False
+
+        key = (archive.path, archive.size, archive.mtime)
+        with self._lock:
+            hits = self._hits.get(key, 0) + 1
+            self._hits[key] = hits
+            if len(self._hits) > 4096:
+                self._hits.clear()
+
+        return hits >= self._hot_hits
+
+    def load(self, archive: ArchiveInfo) -> mmap.mmap:
+        with open(archive.path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+            mapped.madvise(mmap.MADV_WILLNEED)
+
+        key = (archive.path, archive.size, archive.mtime)
+        with self._lock:
+            if key in self._maps:
+                return self._maps[key]
+
+            self._maps[key] = mapped
+            self._total_size += len(mapped)
+            while self._total_size > self._max_total_size and len(self._maps) > 1:
+                # Не закрываем явно: отображение могут ещё отдавать клиенту
+                _, evicted = self._maps.popitem(last=False)
+                self._total_size -= len(evicted)
+
+        return mapped
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"files": len(self._maps), "bytes": self._total_size}
+
+def parse_range(http_range: str, size: int) -> tuple[int, int] | None:
+    units, _, ranges = http_range.partition("=")
+    if units.strip() != "bytes" or "," in ranges:
+        return None
+
+    start, _, end = ranges.strip().partition("-")
+    try:
+        if not start:
+            length = int(end)
+            if length <= 0:
+                raise ValueError
+            return max(size - length, 0), size - 1
+
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+
+    if start >= size:
+        return start, start
+    if start > end:
+        return None
+
+    return start, min(end, size - 1)
+
+class AdmittedFileResponse(FileResponse):
+    # Файл, отданный по допуску: место освобождается и при обрыве соединения
+    def __init__(
+        self,
+        path: str,
+        on_finish: Callable[[], None],
+        **kwargs
+    ) -> None:
+        super().__init__(path, **kwargs)
+        self.on_finish = on_finish
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_finish()
+
+class ArchiveResponse(Response):
+    def __init__(
+        self,
+        archive: ArchiveInfo,
+        headers: dict[str, str] | None = None,
+        media_type: str = "application/octet-stream",
+        filename: str | None = None,
+        mapped: mmap.mmap | None = None,
+        on_sent: Callable[[int], None] | None = None,
+        on_finish: Callable[[], None] | None = None
+    ) -> None:
+        self.archive = archive
+        self.mapped = mapped
+        self.on_sent = on_sent
+        self.on_finish = on_finish
+        self.status_code = 200
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers.setdefault("accept-ranges", "bytes")
+        self.headers.setdefault("etag", archive.etag)
+        self.headers.setdefault("last-modified", formatdate(archive.mtime, usegmt=True))
+        if filename is not None:
+            self.headers.setdefault(
+                "content-disposition", f'attachment; filename="{filename}"'
+            )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self._respond(scope, receive, send)
+        finally:
+            if self.on_finish is not None:
+                self.on_finish()
+
+    async def _respond(self, scope: Scope, receive: Receive, send: Send) -> None:
+        size = self.archive.size
+        start, end = 0, size - 1
+        request_headers = Headers(scope=scope)
+        http_range = request_headers.get("range")
+        http_if_range = request_headers.get("if-range")
+        # If-Range допускает только сильный ETag
+        if http_range is not None and size > 0 and (
+            http_if_range is None or (
+                http_if_range == self.archive.etag and not http_if_range.startswith("W/")
+            )
+        ):
+            byte_range = parse_range(http_range, size)
+            if byte_range is not None and byte_range[0] >= size:
+                await Response(
+                    status_code=416, headers={"content-range": f"bytes */{size}"}
+                )(scope, receive, send)
+                return
+
+            if byte_range is not None:
+                start, end = byte_range
+                self.status_code = 206
+                self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+        count = max(end - start + 1, 0)
+        self.headers["content-length"] = str(count)
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers
+        })
+
+        extensions = scope.get("extensions") or dict()
+        if count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif self.mapped is not None:
+            await self._send_mapped(send, start, count)
+        elif "http.response.zerocopy" in extensions:
+            await self._send_zerocopy(send, start, count)
+        elif "http.response.pathsend" in extensions and self.status_code == 200:
+            await send({
+                "type": "http.response.pathsend",
+                "path": os.path.abspath(self.archive.path)
+            })
+        else:
+            await self._send_chunks(send, start, count)
+
+        if self.on_sent is not None:
+            self.on_sent(count)
+
+    async def _send_mapped(self, send: Send, start: int, count: int) -> None:
+        view = memoryview(self.mapped)
+        end = start + count
+        while start < end:
+            chunk_end = min(start + SEND_CHUNK_SIZE, end)
+            await send({
+                "type": "http.response.body",
+                "body": view[start:chunk_end],
+                "more_body": chunk_end < end
+            })
+            start = chunk_end
+
+    async def _send_zerocopy(self, send: Send, start: int, count: int) -> None:
+        file = await anyio.to_thread.run_sync(open, self.archive.path, "rb")
+        try:
+            await send({
+                "type": "http.response.zerocopy",
+                "file": file,
+                "offset": start,
+                "count": count,
+                "more_body": False
+            })
+        finally:
+            file.close()
+
+    async def _send_chunks(self, send: Send, start: int, count: int) -> None:
+        async with await anyio.open_file(self.archive.path, "rb") as file:
+            await file.seek(start)
+            while count > 0:
+                chunk = await file.read(min(SEND_CHUNK_SIZE, count))
+                if not chunk:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+                    return
+
+                count -= len(chunk)
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": count > 0
+                })
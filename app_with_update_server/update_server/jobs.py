@@ -0,0 +1,50 @@
+import threading
+
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable
+
+from custom_logger import Logger
+from utils import LOG_MAX_BYTES, LOG_BACKUP_COUNT
+
+class BackgroundJobs():
+    def __init__(
+        self, name: str, max_workers: int = 1, executor: Executor | None = None
+    ) -> None:
+        self._logger = Logger(
+            name=name,
+            filename="requests.log",
+            filemode="a+",
+            batched=True,
+            max_bytes=LOG_MAX_BYTES,
+            backup_count=LOG_BACKUP_COUNT
+        )
+        # С общим пулом разные виды задач делят одни и те же потоки
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name.lower()
+        )
+        self._pending: set[str] = set()
+        self._pending_lock = threading.Lock()
+
+    def submit(self, key: str, func: Callable, *args) -> bool:
+        with self._pending_lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+
+        self._executor.submit(self._run, key, func, *args)
+        return True
+
+    def shutdown(self) -> None:
+        if self._owns_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, key: str, func: Callable, *args) -> None:
+        try:
+            func(*args)
+            self._logger.info(f"Built {key}")
+        except Exception:
+            self._logger.error(f"Failed to build {key}", exc_info=True)
+        finally:
+            with self._pending_lock:
+                self._pending.discard(key)
@@ -1,57 +1,329 @@
-import functools
+import hashlib
 import os
+import uuid
 
-from fastapi import FastAPI, Request, Response
-from fastapi.responses import JSONResponse, FileResponse
+import anyio
 
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.responses import JSONResponse
+
+from admission import AdmissionControl
 from custom_logger import Logger
+from deltas import DeltaBuilder, is_delta_fresh
+from file_serving import AdmittedFileResponse, ArchiveResponse, MmapCache
+from jobs import BackgroundJobs
+from manifests import ManifestBuilder, is_manifest_fresh
+from mirror import DiskCache, Mirror
+from metrics import (
+    BYTES_SERVED, DOWNLOADS_REJECTED, CallbackGauge, MetricsMiddleware, cache_lookup, registry
+)
+from release_index import AppReleases, ReleaseIndex
+from uploads import UploadError, is_authorized, publish_archive, receive_archive
 from utils import *
 
 logger = Logger(
     name="API",
     filename="requests.log",
-    filemode="a+"
+    filemode="a+",
+    batched=True,
+    max_bytes=LOG_MAX_BYTES,
+    backup_count=LOG_BACKUP_COUNT
+)
+
+VERSIONS_CACHE_CONTROL = "public, no-cache"
+ARCHIVE_CACHE_CONTROL = "public, max-age=3600"
+# Режим зеркала: архивы берутся с вышестоящего сервера и кэшируются на диске
+UPSTREAM_URL = os.environ.get("UPSTREAM_URL")
+# Без токена загрузка архивов через API выключена
+UPLOAD_TOKEN = os.environ.get("UPLOAD_TOKEN")
+# Имена приложений не начинаются с точки, так что с ними ключ не пересечётся
+BLOB_ADMISSION_KEY = ".blobs"
+
+mmap_cache = MmapCache()
+admission = AdmissionControl()
+worker_pool = ThreadPoolExecutor(
+    max_workers=max(os.cpu_count() or 1, 2), thread_name_prefix="jobs"
 )
+release_index = ReleaseIndex(executor=worker_pool)
+delta_builder = DeltaBuilder(executor=worker_pool)
+manifest_builder = ManifestBuilder(executor=worker_pool)
+publish_jobs = BackgroundJobs("Publish", executor=worker_pool)
+release_index.on_rebuild(delta_builder.schedule)
+release_index.on_rebuild(manifest_builder.schedule)
+mirror = None
+if UPSTREAM_URL:
+    mirror = Mirror(UPSTREAM_URL, DiskCache(
+        max_size=int(os.environ.get("MIRROR_CACHE_MAX_SIZE", MIRROR_CACHE_MAX_SIZE))
+    ))
+    registry.register(CallbackGauge(
+        "update_server_mirror_cache_bytes",
+        "Bytes of archives kept in the mirror disk cache",
+        lambda: mirror.cache.stats()["bytes"]
+    ))
+
+registry.register(CallbackGauge(
+    "update_server_mmap_cache_bytes",
+    "Bytes of archives kept in memory maps",
+    lambda: mmap_cache.stats()["bytes"]
+))
+registry.register(CallbackGauge(
+    "update_server_mmap_cache_files",
+    "Archives kept in memory maps",
+    lambda: mmap_cache.stats()["files"]
+))
+registry.register(CallbackGauge(
+    "update_server_active_downloads",
+    "Archive downloads admitted and not yet finished",
+    admission.get_active
+))
 
 app = FastAPI()
+app.add_middleware(MetricsMiddleware)
+
+async def get_releases(app: str) -> AppReleases | None:
+    if not is_safe_name(app):
+        return None
+
+    releases = release_index.get_cached(app)
+    cache_lookup("release_index", releases is not None)
+    if releases is None:
+        releases = await anyio.to_thread.run_sync(release_index.get, app)
+
+    return releases
+
+def get_client_id(request: Request) -> str:
+    return request.headers.get(CLIENT_ID_HEADER) or request.client.host
+
+def reject_download(client_ip: str, app: str, item: str) -> Response:
+    DOWNLOADS_REJECTED.inc((app,))
+    logger.info(f"{client_ip} was asked to retry download of {app} {item} later")
+    return JSONResponse(
+        content={"detail": "too many downloads"},
+        status_code=503,
+        headers={"Retry-After": str(admission.get_retry_after())}
+    )
+
+@app.get("/metrics")
+def get_metrics() -> Response:
+    return Response(
+        content=registry.expose(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
 
 @app.get("/versions")
-def get_versions(request: Request, app: str) -> Response:
+async def get_versions(request: Request, app: str) -> Response:
     client_ip = request.client.host
     logger.info(f"{client_ip} wanted to see versions of {app}")
-    if not os.path.exists(f"{UPDATE_DIR}/{app}"):
-        return JSONResponse(content={"detail": "not found"}, status_code=404)
+    if mirror is not None:
+        return await mirror.get_versions(
+            app, get_client_id(request), request.headers.get("if-none-match")
+        )
 
-    last_version = ""
-    available_versions = list()
-    for file in os.listdir(f"{UPDATE_DIR}/{app}"):
-        if not file.endswith(UPDATE_FILE_EXT):
-            continue
+    releases = await get_releases(app)
+    if releases is None:
+        return JSONResponse(content={"detail": "not found"}, status_code=404)
 
-        file_version = os.path.basename(file).removesuffix(UPDATE_FILE_EXT)
-        available_versions.append(file_version)
-        last_version = get_higher_version(file_version, last_version)
+    releases = releases.for_client(get_client_id(request))
+    headers = {
+        "ETag": releases.versions_etag,
+        "Cache-Control": VERSIONS_CACHE_CONTROL
+    }
+    if etag_matches(request.headers.get("if-none-match"), releases.versions_etag):
+        return Response(status_code=304, headers=headers)
 
-    available_versions.sort(key=functools.cmp_to_key(compare_version), reverse=True)
-    return JSONResponse(
-        content={
-            "last_version": last_version,
-            "versions": available_versions
-        }
+    return Response(
+        content=releases.versions_body,
+        media_type="application/json",
+        headers=headers
     )
 
+@app.get("/versions/batch")
+async def get_versions_batch(request: Request, apps: list[str] = Query()) -> Response:
+    client_ip = request.client.host
+    logger.info(f"{client_ip} wanted to see versions of {len(apps)} apps")
+    if mirror is not None:
+        return await mirror.get_versions_batch(apps, get_client_id(request))
+
+    client_id = get_client_id(request)
+    last_versions = dict()
+    digest = hashlib.sha256()
+    for app_name in apps:
+        releases = await get_releases(app_name)
+        if releases is None:
+            last_versions[app_name] = None
+            digest.update(f"{app_name}:-".encode("utf-8"))
+        else:
+            releases = releases.for_client(client_id)
+            last_versions[app_name] = releases.last_version
+            digest.update(f"{app_name}:{releases.versions_etag}".encode("utf-8"))
+
+    headers = {
+        "ETag": make_etag(digest.hexdigest()),
+        "Cache-Control": VERSIONS_CACHE_CONTROL
+    }
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    return JSONResponse(content=last_versions, headers=headers)
+
 @app.get("/get_version")
-def get_file_version(
+async def get_file_version(
     request: Request, app: str, version: str
 ) -> Response:
     client_ip = request.client.host
     logger.info(f"{client_ip} is downloading {app} v{version}")
-    file_path = get_app_file_version_path(app, version)
-    if file_path is None:
+    if mirror is not None:
+        if not admission.try_acquire(app):
+            return reject_download(client_ip, app, f"v{version}")
+
+        try:
+            return await mirror.get_version(
+                app,
+                version,
+                get_client_id(request),
+                {"Cache-Control": ARCHIVE_CACHE_CONTROL},
+                request.headers.get("if-none-match"),
+                on_sent=lambda count: BYTES_SERVED.inc((app, version), count),
+                on_finish=lambda: admission.release(app)
+            )
+        except BaseException:
+            admission.release(app)
+            raise
+
+    releases = await get_releases(app)
+    archive = releases.get_archive(version) if releases is not None else None
+    if archive is None:
+        return JSONResponse(content={"detail": "not found"}, status_code=404)
+
+    headers = {
+        "ETag": archive.etag,
+        "Cache-Control": ARCHIVE_CACHE_CONTROL
+    }
+    if etag_matches(request.headers.get("if-none-match"), archive.etag):
+        return Response(status_code=304, headers=headers)
+
+    if not admission.try_acquire(app):
+        return reject_download(client_ip, app, f"v{version}")
+
+    mapped = mmap_cache.get(archive)
+    cache_lookup("mmap", mapped is not None)
+    try:
+        if mapped is None and mmap_cache.is_hot(archive):
+            mapped = await anyio.to_thread.run_sync(mmap_cache.load, archive)
+    except BaseException:
+        admission.release(app)
+        raise
+
+    return ArchiveResponse(
+        archive,
+        headers=headers,
+        filename=os.path.basename(archive.path),
+        mapped=mapped,
+        on_sent=lambda count: BYTES_SERVED.inc((app, version), count),
+        on_finish=lambda: admission.release(app)
+    )
+
+@app.put("/upload")
+async def upload_version(request: Request, app: str, version: str) -> Response:
+    client_ip = request.client.host
+    if mirror is not None or not is_authorized(
+        request.headers.get("authorization"), UPLOAD_TOKEN
+    ):
+        logger.warning(f"{client_ip} was denied upload of {app} v{version}")
+        return JSONResponse(content={"detail": "forbidden"}, status_code=403)
+
+    try:
+        version = str(Version(version))
+    except ValueError:
+        version = ""
+    if not is_safe_name(app) or not is_safe_name(version):
+        return JSONResponse(content={"detail": "invalid app or version"}, status_code=400)
+
+    file_path = make_app_file_version_path(app, version)
+    if os.path.exists(file_path):
+        return JSONResponse(content={"detail": "version exists"}, status_code=409)
+
+    logger.info(f"{client_ip} is uploading {app} v{version}")
+    tmp_dir = os.path.join(UPDATE_DIR, UPLOAD_TMP_DIR)
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(tmp_dir, f"{uuid.uuid4().hex}.part")
+    try:
+        archive_hash = await receive_archive(request, tmp_path)
+        release_index.add_archive(file_path, archive_hash, os.stat(tmp_path))
+        await anyio.to_thread.run_sync(publish_archive, tmp_path, file_path)
+    except UploadError as e:
+        return JSONResponse(content={"detail": e.detail}, status_code=e.status_code)
+    except FileExistsError:
+        return JSONResponse(content={"detail": "version exists"}, status_code=409)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    # Индекс, дельты и манифесты готовятся в фоне, до первого запроса клиента
+    publish_jobs.submit(file_path, release_index.get, app)
+    logger.info(f"{client_ip} published {app} v{version} ({archive_hash})")
+    return JSONResponse(
+        content={"app": app, "version": version, "hash": archive_hash},
+        status_code=201,
+        headers={"ETag": make_etag(archive_hash)}
+    )
+
+@app.get("/get_delta")
+def get_delta(
+    request: Request, app: str, from_version: str, version: str
+) -> Response:
+    client_ip = request.client.host
+    logger.info(f"{client_ip} is downloading {app} delta {from_version} -> {version}")
+    if not all(map(is_safe_name, (app, from_version, version))):
+        return JSONResponse(content={"detail": "not found"}, status_code=404)
+
+    file_path = get_app_delta_path(app, from_version, version)
+    if file_path is None or not is_delta_fresh(app, from_version, version):
         return JSONResponse(content={"detail": "not found"}, status_code=404)
 
-    return FileResponse(
+    if not admission.try_acquire(app):
+        return reject_download(client_ip, app, f"delta {from_version} -> {version}")
+
+    return AdmittedFileResponse(
         file_path,
+        on_finish=lambda: admission.release(app),
         media_type="application/octet-stream",
         filename=os.path.basename(file_path)
     )
+
+@app.get("/manifest")
+def get_manifest(request: Request, app: str, version: str) -> Response:
+    client_ip = request.client.host
+    logger.info(f"{client_ip} wanted to see manifest of {app} v{version}")
+    if not is_safe_name(app) or not is_safe_name(version):
+        return JSONResponse(content={"detail": "not found"}, status_code=404)
+
+    file_path = get_app_manifest_path(app, version)
+    if file_path is None or not is_manifest_fresh(app, version):
+        return JSONResponse(content={"detail": "not found"}, status_code=404)
+
+    if not admission.try_acquire(app):
+        return reject_download(client_ip, app, f"manifest v{version}")
+
+    return AdmittedFileResponse(
+        file_path, on_finish=lambda: admission.release(app), media_type="application/json"
+    )
+
+@app.get("/blob/{blob_hash}")
+def get_blob(request: Request, blob_hash: str) -> Response:
+    file_path = get_blob_path(blob_hash)
+    if file_path is None:
+        return JSONResponse(content={"detail": "not found"}, status_code=404)
+
+    # Блоб общий для приложений, и доверять приложению из запроса нельзя:
+    # все блобы делят одну квоту
+    if not admission.try_acquire(BLOB_ADMISSION_KEY):
+        return reject_download(request.client.host, BLOB_ADMISSION_KEY, f"blob {blob_hash}")
+
+    return AdmittedFileResponse(
+        file_path,
+        on_finish=lambda: admission.release(BLOB_ADMISSION_KEY),
+        media_type="application/octet-stream"
+    )
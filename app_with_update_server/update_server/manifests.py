@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import tarfile
+import tempfile
+
+from concurrent.futures import Executor
+
+from jobs import BackgroundJobs
+from release_index import AppReleases
+from utils import *
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+def _store_blob(source) -> tuple[str, int]:
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(dir=BLOB_DIR, delete=False) as tmp:
+        for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            tmp.write(chunk)
+            size += len(chunk)
+
+    blob_hash = digest.hexdigest()
+    blob_path = make_blob_path(blob_hash)
+    if os.path.exists(blob_path):
+        # Такой файл уже есть в другой версии: храним его один раз
+        os.remove(tmp.name)
+    else:
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.replace(tmp.name, blob_path)
+
+    return blob_hash, size
+
+def build_manifest(app: str, version: str) -> str:
+    archive_path = get_app_file_version_path(app, version)
+    if archive_path is None:
+        raise FileNotFoundError(f"{app}: no archive for {version}")
+
+    files = dict()
+    links = dict()
+    with tarfile.open(archive_path, "r:gz") as archive:
+        for member in archive:
+            name = os.path.normpath(member.name)
+            if name == "." or os.path.isabs(name) or name.startswith(".."):
+                continue
+
+            if member.isfile():
+                with archive.extractfile(member) as f:
+                    blob_hash, size = _store_blob(f)
+                files[name] = {"hash": blob_hash, "size": size, "mode": member.mode}
+            elif member.issym():
+                links[name] = member.linkname
+
+    manifest_path = make_app_manifest_path(app, version)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    # Имя временного файла уникально: манифест могут строить несколько
+    # процессов сервера одновременно
+    tmp = tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=os.path.dirname(manifest_path), suffix=".tmp", delete=False
+    )
+    try:
+        with tmp:
+            json.dump({"version": version, "files": files, "links": links}, tmp)
+        os.replace(tmp.name, manifest_path)
+    finally:
+        if os.path.exists(tmp.name):
+            os.remove(tmp.name)
+
+    return manifest_path
+
+def is_manifest_fresh(app: str, version: str) -> bool:
+    try:
+        manifest_mtime = os.stat(make_app_manifest_path(app, version)).st_mtime_ns
+        archive_path = f"{UPDATE_DIR}/{app}/{version}{UPDATE_FILE_EXT}"
+        return os.stat(archive_path).st_mtime_ns <= manifest_mtime
+    except OSError:
+        return False
+
+class ManifestBuilder():
+    def __init__(self, max_workers: int = 1, executor: Executor | None = None) -> None:
+        self._jobs = BackgroundJobs("Manifests", max_workers, executor)
+
+    def schedule(self, releases: AppReleases) -> None:
+        for version in releases.versions:
+            if is_manifest_fresh(releases.app, version):
+                continue
+
+            self._jobs.submit(
+                make_app_manifest_path(releases.app, version),
+                build_manifest, releases.app, version
+            )
+
+    def shutdown(self) -> None:
+        self._jobs.shutdown()
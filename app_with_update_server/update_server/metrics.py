@@ -0,0 +1,250 @@
+import os
+import threading
+import time
+
+from typing import Callable
+
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class _Shards():
+    # Каждый поток пишет в свой словарь без блокировок, при выгрузке всё суммируется
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._shards: list[dict] = list()
+        self._lock = threading.Lock()
+
+    def get(self) -> dict:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = dict()
+            self._local.values = values
+            with self._lock:
+                self._shards.append(values)
+            return values
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            shards = list(self._shards)
+
+        return [dict(shard) for shard in shards]
+
+class _Metric():
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._shards = _Shards()
+
+    def _format_labels(self, values: tuple, extra: dict[str, str] | None = None) -> str:
+        pairs = list(zip(self.labels, values))
+        if extra:
+            pairs.extend(extra.items())
+        if not pairs:
+            return ""
+
+        body = ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs)
+        return f"{{{body}}}"
+
+    def _header(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}"
+        ]
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        shard = self._shards.get()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def expose(self) -> list[str]:
+        totals = dict()
+        for shard in self._shards.snapshot():
+            for labels, value in shard.items():
+                totals[labels] = totals.get(labels, 0) + value
+
+        lines = self._header()
+        for labels, value in sorted(totals.items()):
+            lines.append(f"{self.name}{self._format_labels(labels)} {value}")
+        return lines
+
+class Gauge(Counter):
+    metric_type = "gauge"
+
+    def dec(self, labels: tuple = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+class CallbackGauge(_Metric):
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]) -> None:
+        super().__init__(name, documentation)
+        self._callback = callback
+
+    def expose(self) -> list[str]:
+        return self._header() + [f"{self.name} {self._callback()}"]
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        shard = self._shards.get()
+        state = shard.get(labels)
+        if state is None:
+            # Счётчики по корзинам, затем сумма и количество
+            state = [0] * (len(self.buckets) + 2)
+            shard[labels] = state
+
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[index] += 1
+                break
+        state[-2] += value
+        state[-1] += 1
+
+    def expose(self) -> list[str]:
+        totals: dict[tuple, list] = dict()
+        for shard in self._shards.snapshot():
+            for labels, state in shard.items():
+                total = totals.setdefault(labels, [0] * len(state))
+                for index, value in enumerate(state):
+                    total[index] += value
+
+        lines = self._header()
+        for labels, state in sorted(totals.items()):
+            cumulative = 0
+            for index, bound in enumerate(self.buckets):
+                cumulative += state[index]
+                lines.append(
+                    f"{self.name}_bucket{self._format_labels(labels, {'le': str(bound)})} "
+                    f"{cumulative}"
+                )
+            lines.append(
+                f"{self.name}_bucket{self._format_labels(labels, {'le': '+Inf'})} {state[-1]}"
+            )
+            lines.append(f"{self.name}_sum{self._format_labels(labels)} {state[-2]}")
+            lines.append(f"{self.name}_count{self._format_labels(labels)} {state[-1]}")
+        return lines
+
+class Registry():
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = list()
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        lines = list()
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+REQUEST_DURATION = registry.register(Histogram(
+    "update_server_request_duration_seconds",
+    "Request latency by endpoint",
+    ("endpoint",)
+))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    "update_server_requests_in_flight",
+    "Requests being processed by endpoint",
+    ("endpoint",)
+))
+RESPONSES = registry.register(Counter(
+    "update_server_responses_total",
+    "Responses by endpoint and status code",
+    ("endpoint", "status")
+))
+BYTES_SERVED = registry.register(Counter(
+    "update_server_bytes_served_total",
+    "Archive bytes sent by app and version",
+    ("app", "version")
+))
+DOWNLOADS_REJECTED = registry.register(Counter(
+    "update_server_downloads_rejected_total",
+    "Archive downloads rejected by admission control",
+    ("app",)
+))
+CACHE_REQUESTS = registry.register(Counter(
+    "update_server_cache_requests_total",
+    "Cache lookups by cache and result",
+    ("cache", "result")
+))
+registry.register(CallbackGauge(
+    "update_server_worker_pid",
+    "PID of the worker process serving this scrape",
+    os.getpid
+))
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc((cache, "hit" if hit else "miss"))
+
+class MetricsMiddleware():
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    def _get_endpoint(self, scope: Scope) -> str:
+        # Шаблон пути нужен ещё до маршрутизации, для запросов в работе:
+        # сопоставляем маршруты сами, неизвестные пути сводим в "other",
+        # чтобы не плодить метки
+        endpoint = "other"
+        for route in getattr(scope.get("app"), "routes", None) or list():
+            if not hasattr(route, "path"):
+                continue
+
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+            if match == Match.PARTIAL and endpoint == "other":
+                endpoint = route.path
+
+        return endpoint
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Одна и та же метка у всех трёх метрик, чтобы ряды можно было сопоставить
+        endpoint = self._get_endpoint(scope)
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc((endpoint,))
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec((endpoint,))
+            REQUEST_DURATION.observe(time.perf_counter() - start, (endpoint,))
+            RESPONSES.inc((endpoint, str(status_code)))
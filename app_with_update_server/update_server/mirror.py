@@ -0,0 +1,417 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+from typing import Callable
+
+import anyio
+import httpx
+
+from starlette.responses import JSONResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from file_serving import SEND_CHUNK_SIZE, ArchiveResponse
+from metrics import cache_lookup
+from release_index import ArchiveInfo
+from utils import *
+
+VERSIONS_CACHE_DIR = "versions"
+PART_FILE_EXT = ".part"
+META_FILE_EXT = ".meta.json"
+UPSTREAM_TIMEOUT = httpx.Timeout(10.0, read=60.0)
+TOUCH_INTERVAL = 60.0
+
+class DiskCache():
+    def __init__(
+        self, cache_dir: str = MIRROR_CACHE_DIR, max_size: int = MIRROR_CACHE_MAX_SIZE
+    ) -> None:
+        self.cache_dir = cache_dir
+        self._max_size = max_size
+        self._entries: OrderedDict[str, ArchiveInfo] = OrderedDict()
+        self._total_size = 0
+        self._touched_at: dict[str, float] = dict()
+        self._lock = threading.Lock()
+        self._load()
+
+    def get_path(self, app: str, version: str) -> str:
+        return os.path.join(self.cache_dir, app, f"{version}{UPDATE_FILE_EXT}")
+
+    def get(self, app: str, version: str) -> ArchiveInfo | None:
+        path = self.get_path(app, version)
+        with self._lock:
+            archive = self._entries.get(path)
+            if archive is None:
+                return None
+            self._entries.move_to_end(path)
+
+        return archive
+
+    def should_touch(self, archive: ArchiveInfo) -> bool:
+        # Порядок вытеснения переживает перезапуск: он восстанавливается по atime.
+        # Часто запрашиваемый архив достаточно отмечать раз в TOUCH_INTERVAL
+        now = time.monotonic()
+        with self._lock:
+            touched_at = self._touched_at.get(archive.path)
+            if touched_at is not None and now - touched_at < TOUCH_INTERVAL:
+                return False
+
+            self._touched_at[archive.path] = now
+            return True
+
+    def touch(self, archive: ArchiveInfo) -> None:
+        # Меняем только atime: mtime отдаётся клиентам в Last-Modified
+        try:
+            os.utime(archive.path, ns=(time.time_ns(), os.stat(archive.path).st_mtime_ns))
+        except OSError:
+            pass
+
+    def add(self, app: str, version: str, part_path: str, archive_hash: str) -> ArchiveInfo:
+        path = self.get_path(app, version)
+        with open(f"{path}{META_FILE_EXT}", "w", encoding="utf-8") as f:
+            json.dump({"hash": archive_hash}, f)
+        os.replace(part_path, path)
+
+        stat = os.stat(path)
+        archive = ArchiveInfo(path, stat.st_size, stat.st_mtime, archive_hash)
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous is not None:
+                self._total_size -= previous.size
+            self._entries[path] = archive
+            self._total_size += archive.size
+            evicted = self._evict()
+
+        for evicted_path in evicted:
+            for file_path in (evicted_path, f"{evicted_path}{META_FILE_EXT}"):
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+
+        return archive
+
+    def make_part_path(self, app: str, version: str) -> str:
+        os.makedirs(os.path.join(self.cache_dir, app), exist_ok=True)
+        return f"{self.get_path(app, version)}.{uuid.uuid4().hex}{PART_FILE_EXT}"
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"files": len(self._entries), "bytes": self._total_size}
+
+    def _evict(self) -> list[str]:
+        evicted = list()
+        # Только что добавленный архив не вытесняем, даже если он больше лимита
+        while self._total_size > self._max_size and len(self._entries) > 1:
+            path, archive = self._entries.popitem(last=False)
+            self._total_size -= archive.size
+            self._touched_at.pop(path, None)
+            evicted.append(path)
+
+        return evicted
+
+    def _load(self) -> None:
+        if not os.path.isdir(self.cache_dir):
+            return
+
+        found = list()
+        for app in os.listdir(self.cache_dir):
+            app_dir = os.path.join(self.cache_dir, app)
+            if app == VERSIONS_CACHE_DIR or not os.path.isdir(app_dir):
+                continue
+
+            for file in os.listdir(app_dir):
+                path = os.path.join(app_dir, file)
+                if file.endswith(PART_FILE_EXT):
+                    # Недокачанные при прошлом запуске архивы
+                    os.remove(path)
+                    continue
+                if not file.endswith(UPDATE_FILE_EXT):
+                    continue
+
+                try:
+                    with open(f"{path}{META_FILE_EXT}", encoding="utf-8") as f:
+                        archive_hash = json.load(f)["hash"]
+                    stat = os.stat(path)
+                except (OSError, ValueError, KeyError):
+                    continue
+
+                found.append((
+                    stat.st_atime, ArchiveInfo(path, stat.st_size, stat.st_mtime, archive_hash)
+                ))
+
+        for _, archive in sorted(found, key=lambda item: item[0]):
+            self._entries[archive.path] = archive
+            self._total_size += archive.size
+
+        for path in self._evict():
+            for file_path in (path, f"{path}{META_FILE_EXT}"):
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+
+class _Fetch():
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.status = 502
+        self.headers: dict[str, str] = dict()
+        self.written = 0
+        self.done = False
+        self.failed = False
+        self.started = asyncio.Event()
+        self._progress = asyncio.Event()
+
+    def notify(self) -> None:
+        self._progress.set()
+        self._progress = asyncio.Event()
+
+    async def wait(self, seen: int) -> None:
+        while self.written <= seen and not self.done:
+            await self._progress.wait()
+
+class _FetchResponse(Response):
+    # Отдаёт клиенту архив, пока он ещё скачивается с вышестоящего сервера
+    def __init__(
+        self,
+        fetch: _Fetch,
+        headers: dict[str, str] | None = None,
+        filename: str | None = None,
+        on_sent: Callable[[int], None] | None = None,
+        on_finish: Callable[[], None] | None = None
+    ) -> None:
+        self.fetch = fetch
+        self.on_sent = on_sent
+        self.on_finish = on_finish
+        self.status_code = 200
+        self.media_type = "application/octet-stream"
+        self.background = None
+        self.init_headers(headers)
+        for name in ("content-length", "etag", "last-modified"):
+            if name in fetch.headers:
+                self.headers[name] = fetch.headers[name]
+        if filename is not None:
+            self.headers["content-disposition"] = f'attachment; filename="{filename}"'
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self._respond(send)
+        finally:
+            if self.on_finish is not None:
+                self.on_finish()
+
+    async def _respond(self, send: Send) -> None:
+        fetch = self.fetch
+        with open(fetch.path, "rb") as f:
+            await send({
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers
+            })
+
+            sent = 0
+            while True:
+                if sent < fetch.written:
+                    chunk = await anyio.to_thread.run_sync(
+                        f.read, min(SEND_CHUNK_SIZE, fetch.written - sent)
+                    )
+                    sent += len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                elif fetch.done:
+                    if fetch.failed:
+                        raise RuntimeError("upstream download failed")
+                    break
+                else:
+                    await fetch.wait(sent)
+
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.on_sent is not None:
+            self.on_sent(sent)
+
+class Mirror():
+    def __init__(self, upstream_url: str, cache: DiskCache) -> None:
+        self.upstream_url = upstream_url.rstrip("/")
+        self.cache = cache
+        self._client = httpx.AsyncClient(base_url=self.upstream_url, timeout=UPSTREAM_TIMEOUT)
+        self._fetches: dict[tuple[str, str], _Fetch] = dict()
+        self._tasks: set[asyncio.Task] = set()
+
+    async def get_versions(self, app: str, client_id: str, if_none_match: str | None) -> Response:
+        if not is_safe_name(app):
+            return JSONResponse(content={"detail": "not found"}, status_code=404)
+
+        # Список версий зависит от клиента (поэтапный выкат), поэтому всегда
+        # сверяемся с вышестоящим сервером, а копия нужна на время его недоступности
+        headers = {CLIENT_ID_HEADER: client_id}
+        if if_none_match:
+            headers["If-None-Match"] = if_none_match
+        try:
+            response = await self._client.get("/versions", params={"app": app}, headers=headers)
+        except httpx.HTTPError:
+            response = None
+
+        if response is not None and response.status_code in (200, 304, 404):
+            response_headers = {
+                name: response.headers[name]
+                for name in ("etag", "cache-control") if name in response.headers
+            }
+            if response.status_code == 200:
+                await anyio.to_thread.run_sync(
+                    self._save_versions, app, response.headers.get("etag", ""), response.content
+                )
+            return Response(
+                content=response.content if response.status_code != 304 else None,
+                status_code=response.status_code,
+                headers=response_headers,
+                media_type="application/json"
+            )
+
+        cached = await anyio.to_thread.run_sync(self._load_versions, app)
+        if cached is None:
+            return JSONResponse(content={"detail": "upstream unavailable"}, status_code=502)
+
+        etag, body = cached
+        headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+        if etag and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    async def get_versions_batch(self, apps: list[str], client_id: str) -> Response:
+        try:
+            response = await self._client.get(
+                "/versions/batch", params={"apps": apps}, headers={CLIENT_ID_HEADER: client_id}
+            )
+            if response.status_code == 200:
+                return Response(content=response.content, media_type="application/json")
+        except httpx.HTTPError:
+            pass
+
+        last_versions = dict()
+        for app in apps:
+            cached = await anyio.to_thread.run_sync(self._load_versions, app) \
+                if is_safe_name(app) else None
+            last_versions[app] = json.loads(cached[1])["last_version"] if cached else None
+
+        return JSONResponse(content=last_versions)
+
+    async def get_version(
+        self,
+        app: str,
+        version: str,
+        client_id: str,
+        headers: dict[str, str],
+        if_none_match: str | None,
+        on_sent: Callable[[int], None],
+        on_finish: Callable[[], None]
+    ) -> Response:
+        if not is_safe_name(app) or not is_safe_name(version):
+            on_finish()
+            return JSONResponse(content={"detail": "not found"}, status_code=404)
+
+        filename = f"{version}{UPDATE_FILE_EXT}"
+        archive = self.cache.get(app, version)
+        cache_lookup("mirror", archive is not None)
+        if archive is not None:
+            if self.cache.should_touch(archive):
+                await anyio.to_thread.run_sync(self.cache.touch, archive)
+            if etag_matches(if_none_match, archive.etag):
+                on_finish()
+                return Response(status_code=304, headers={"ETag": archive.etag, **headers})
+
+            return ArchiveResponse(
+                archive,
+                headers=headers,
+                filename=filename,
+                on_sent=on_sent,
+                on_finish=on_finish
+            )
+
+        # Одновременные промахи по одному архиву ждут одну загрузку
+        key = (app, version)
+        fetch = self._fetches.get(key)
+        if fetch is None:
+            fetch = _Fetch(self.cache.make_part_path(app, version))
+            self._fetches[key] = fetch
+            task = asyncio.create_task(self._fetch(key, fetch, client_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        await fetch.started.wait()
+        if fetch.status != 200:
+            on_finish()
+            error_headers = dict()
+            if "retry-after" in fetch.headers:
+                error_headers["Retry-After"] = fetch.headers["retry-after"]
+            return JSONResponse(
+                content={"detail": "upstream error"},
+                status_code=fetch.status if fetch.status in (404, 503) else 502,
+                headers=error_headers
+            )
+
+        return _FetchResponse(
+            fetch, headers=headers, filename=filename, on_sent=on_sent, on_finish=on_finish
+        )
+
+    async def _fetch(self, key: tuple[str, str], fetch: _Fetch, client_id: str) -> None:
+        app, version = key
+        try:
+            async with self._client.stream(
+                "GET",
+                "/get_version",
+                params={"app": app, "version": version},
+                headers={CLIENT_ID_HEADER: client_id}
+            ) as response:
+                fetch.status = response.status_code
+                fetch.headers = {name.lower(): value for name, value in response.headers.items()}
+                if response.status_code != 200:
+                    return
+
+                digest = hashlib.sha256()
+                # Без буферизации: читатели видят ровно fetch.written байт
+                async with await anyio.open_file(fetch.path, "wb", buffering=0) as f:
+                    # Файл создан: с этого момента его могут читать клиенты
+                    fetch.started.set()
+                    async for chunk in response.aiter_raw():
+                        await f.write(chunk)
+                        digest.update(chunk)
+                        fetch.written += len(chunk)
+                        fetch.notify()
+
+            archive_hash = digest.hexdigest()
+            etag = fetch.headers.get("etag", "").strip('"')
+            if len(etag) == 64 and etag != archive_hash:
+                raise ValueError(f"hash mismatch for {app} v{version}")
+
+            archive = self.cache.add(app, version, fetch.path, archive_hash)
+            fetch.path = archive.path
+        except Exception:
+            fetch.failed = True
+            if os.path.exists(fetch.path) and fetch.path.endswith(PART_FILE_EXT):
+                os.remove(fetch.path)
+        finally:
+            self._fetches.pop(key, None)
+            fetch.done = True
+            fetch.started.set()
+            fetch.notify()
+
+    def _get_versions_path(self, app: str) -> str:
+        return os.path.join(self.cache.cache_dir, VERSIONS_CACHE_DIR, f"{app}.json")
+
+    def _save_versions(self, app: str, etag: str, body: bytes) -> None:
+        path = self._get_versions_path(app)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"etag": etag, "body": body.decode("utf-8")}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _load_versions(self, app: str) -> tuple[str, bytes] | None:
+        try:
+            with open(self._get_versions_path(app), encoding="utf-8") as f:
+                cached = json.load(f)
+            return cached["etag"], cached["body"].encode("utf-8")
+        except (OSError, ValueError, KeyError):
+            return None
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from concurrent.futures import Executor
+from typing import Callable
+
+from jobs import BackgroundJobs
+from rollout import Rollout, load_rollout
+from utils import *
+
+class ArchiveInfo():
+    def __init__(
+        self, path: str, size: int, mtime: float, archive_hash: str | None
+    ) -> None:
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.hash = archive_hash
+        if archive_hash is not None:
+            self.etag = make_etag(archive_hash)
+        else:
+            # Пока хеш считается в фоне, отдаём слабый ETag по размеру и времени
+            self.etag = "W/" + make_etag(f"{size:x}-{int(mtime * 1_000_000):x}")
+
+class AppReleases():
+    def __init__(
+        self,
+        app: str,
+        stamp: tuple[int, int],
+        versions: list[Version],
+        archives: dict[str, ArchiveInfo],
+        rollout: Rollout | None = None
+    ) -> None:
+        self.app = app
+        self.stamp = stamp
+        self.checked_at = time.monotonic()
+        self.versions = versions
+        self.archives = archives
+        self.last_version = versions[0] if versions else ""
+        # Тело ответа /versions сериализуем один раз, при построении индекса
+        self.versions_body = json.dumps(
+            {
+                "last_version": self.last_version,
+                "versions": self.versions
+            },
+            ensure_ascii=False,
+            separators=(",", ":")
+        ).encode("utf-8")
+
+        digest = hashlib.sha256(self.versions_body)
+        for version in self.versions:
+            digest.update(self.archives[version].etag.encode("ascii"))
+        self.versions_etag = make_etag(digest.hexdigest())
+
+        # Клиентам вне поэтапного выката отдаём список без выкатываемых версий
+        self.rollout = None
+        self.held_back = None
+        if rollout is not None and rollout.version in archives:
+            self.rollout = rollout
+            self.held_back = AppReleases(
+                app,
+                stamp,
+                [version for version in versions if version < rollout.version],
+                archives
+            )
+
+    def for_client(self, client_id: str) -> "AppReleases":
+        if self.held_back is None or self.rollout.includes(self.app, client_id):
+            return self
+
+        return self.held_back
+
+    def get_archive(self, version: str) -> ArchiveInfo | None:
+        try:
+            return self.archives.get(Version(version))
+        except ValueError:
+            return None
+
+class ReleaseIndex():
+    def __init__(
+        self,
+        update_dir: str = UPDATE_DIR,
+        check_interval: float = 1.0,
+        executor: Executor | None = None
+    ) -> None:
+        self._update_dir = update_dir
+        self._check_interval = check_interval
+        self._releases: dict[str, AppReleases] = dict()
+        self._build_locks: dict[str, threading.Lock] = dict()
+        self._build_locks_guard = threading.Lock()
+        self._rebuild_callbacks: list[Callable[[AppReleases], None]] = list()
+        self._archives: dict[str, tuple[int, int, ArchiveInfo]] = dict()
+        self._archives_lock = threading.Lock()
+        self._hash_jobs = BackgroundJobs("Hashes", executor=executor)
+        # Сколько архивов приложения ещё хешируется (под _archives_lock)
+        self._hashing: dict[str, int] = dict()
+
+    def get_cached(self, app: str) -> AppReleases | None:
+        # Без обращения к диску: индекс, проверенный не раньше check_interval назад
+        releases = self._releases.get(app)
+        if releases is None or time.monotonic() - releases.checked_at > self._check_interval:
+            return None
+
+        return releases
+
+    def get(self, app: str) -> AppReleases | None:
+        app_dir = os.path.join(self._update_dir, app)
+        try:
+            stamp = self._get_stamp(app_dir)
+        except OSError:
+            self._releases.pop(app, None)
+            return None
+
+        releases = self._releases.get(app)
+        if releases is not None and releases.stamp == stamp:
+            releases.checked_at = time.monotonic()
+            return releases
+
+        # Параллельные запросы к одному приложению ждут одну пересборку
+        with self._get_build_lock(app):
+            releases = self._releases.get(app)
+            if releases is not None and releases.stamp == stamp:
+                return releases
+
+            releases = self._build(app, app_dir, stamp)
+            self._releases[app] = releases
+
+        for callback in self._rebuild_callbacks:
+            callback(releases)
+
+        return releases
+
+    def on_rebuild(self, callback: Callable[[AppReleases], None]) -> None:
+        self._rebuild_callbacks.append(callback)
+
+    def invalidate(self, app: str | None = None) -> None:
+        if app is None:
+            self._releases.clear()
+        else:
+            self._releases.pop(app, None)
+
+    def add_archive(self, path: str, archive_hash: str, stat: os.stat_result) -> None:
+        # Хеш уже известен (например, посчитан при загрузке): пересборка индекса
+        # не будет читать архив заново
+        archive = ArchiveInfo(path, stat.st_size, stat.st_mtime, archive_hash)
+        with self._archives_lock:
+            self._archives[path] = (stat.st_size, stat.st_mtime_ns, archive)
+
+    def _get_build_lock(self, app: str) -> threading.Lock:
+        with self._build_locks_guard:
+            lock = self._build_locks.get(app)
+            if lock is None:
+                lock = threading.Lock()
+                self._build_locks[app] = lock
+            return lock
+
+    def _get_stamp(self, app_dir: str) -> tuple[int, int]:
+        # Правка rollout.json на месте не меняет mtime папки, поэтому
+        # учитываем и mtime самого файла
+        dir_mtime_ns = os.stat(app_dir).st_mtime_ns
+        try:
+            rollout_mtime_ns = os.stat(os.path.join(app_dir, ROLLOUT_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            rollout_mtime_ns = 0
+
+        return dir_mtime_ns, rollout_mtime_ns
+
+    def _build(self, app: str, app_dir: str, stamp: tuple[int, int]) -> AppReleases:
+        versions = list()
+        archives = dict()
+        for file in os.listdir(app_dir):
+            if not file.endswith(UPDATE_FILE_EXT):
+                continue
+
+            try:
+                version = Version(file.removesuffix(UPDATE_FILE_EXT))
+                archives[version] = self._get_archive(app, os.path.join(app_dir, file))
+            except (ValueError, OSError):
+                continue
+
+            versions.append(version)
+
+        versions.sort(key=version_key, reverse=True)
+        return AppReleases(app, stamp, versions, archives, load_rollout(app_dir))
+
+    def _get_archive(self, app: str, path: str) -> ArchiveInfo:
+        # Хеш архива пересчитываем только если файл изменился, и не в запросе:
+        # до готовности хеша архив отдаётся со слабым ETag
+        stat = os.stat(path)
+        with self._archives_lock:
+            cached = self._archives.get(path)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+
+        archive = ArchiveInfo(path, stat.st_size, stat.st_mtime, None)
+        with self._archives_lock:
+            self._archives[path] = (stat.st_size, stat.st_mtime_ns, archive)
+            self._hashing[app] = self._hashing.get(app, 0) + 1
+
+        if not self._hash_jobs.submit(path, self._hash_archive, app, path, stat):
+            self._finish_hashing(app)
+        return archive
+
+    def _hash_archive(self, app: str, path: str, stat: os.stat_result) -> None:
+        try:
+            while True:
+                archive_hash = hash_file(path)
+                # Файл мог измениться, пока его читали: тогда считаем заново
+                current = os.stat(path)
+                if (current.st_size, current.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                    break
+                stat = current
+
+            self.add_archive(path, archive_hash, stat)
+        finally:
+            self._finish_hashing(app)
+
+    def _finish_hashing(self, app: str) -> None:
+        with self._archives_lock:
+            remaining = self._hashing.get(app, 0) - 1
+            if remaining > 0:
+                self._hashing[app] = remaining
+            else:
+                self._hashing.pop(app, None)
+
+        # Индекс пересобирается один раз, когда посчитаны все хеши приложения:
+        # иначе при старте ETag списка версий менялся бы на каждом архиве
+        if remaining <= 0:
+            self.invalidate(app)
@@ -0,0 +1,51 @@
+import hashlib
+import json
+import os
+import time
+
+from utils import *
+
+class Rollout():
+    def __init__(
+        self,
+        version: str,
+        percent: float,
+        ramp_seconds: float = 0.0,
+        started_at: float = 0.0
+    ) -> None:
+        self.version = Version(version)
+        self.percent = min(max(percent, 0.0), 100.0)
+        self.ramp_seconds = max(ramp_seconds, 0.0)
+        self.started_at = started_at
+
+    def get_percent(self, now: float | None = None) -> float:
+        if self.ramp_seconds <= 0:
+            return self.percent
+
+        # Доля линейно растёт от percent до 100 за ramp_seconds
+        elapsed = (time.time() if now is None else now) - self.started_at
+        progress = min(max(elapsed / self.ramp_seconds, 0.0), 1.0)
+        return self.percent + (100.0 - self.percent) * progress
+
+    def includes(self, app: str, client_id: str) -> bool:
+        # Корзина клиента постоянна для версии, поэтому при росте доли
+        # уже получившие версию клиенты её не теряют
+        digest = hashlib.sha256(f"{app}:{self.version}:{client_id}".encode("utf-8")).digest()
+        bucket = int.from_bytes(digest[:4], "big") / 2 ** 32 * 100
+        return bucket < self.get_percent()
+
+def load_rollout(app_dir: str) -> Rollout | None:
+    # updates/<app>/rollout.json: {"version": "1.3", "percent": 10, "ramp_hours": 24}
+    rollout_path = os.path.join(app_dir, ROLLOUT_FILE)
+    try:
+        with open(rollout_path, encoding="utf-8") as f:
+            config = json.load(f)
+
+        return Rollout(
+            str(config["version"]),
+            float(config.get("percent", 0)),
+            float(config.get("ramp_hours", 0)) * 3600,
+            float(config.get("start", os.path.getmtime(rollout_path)))
+        )
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
@@ -0,0 +1,74 @@
+import hashlib
+import hmac
+import os
+
+import anyio
+
+from starlette.requests import Request
+
+from utils import *
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, detail: str) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def is_authorized(authorization: str | None, token: str | None) -> bool:
+    if not token or not authorization:
+        return False
+
+    scheme, _, value = authorization.partition(" ")
+    if scheme.lower() != "bearer":
+        return False
+
+    return hmac.compare_digest(value.strip().encode("utf-8"), token.encode("utf-8"))
+
+async def receive_archive(
+    request: Request, tmp_path: str, max_size: int = UPLOAD_MAX_SIZE
+) -> str:
+    # Тело запроса пишется на диск по мере получения, хеш считается попутно
+    digest = hashlib.sha256()
+    size = 0
+    buffer = bytearray()
+    async with await anyio.open_file(tmp_path, "wb") as f:
+        async for chunk in request.stream():
+            if size == 0 and chunk and not chunk.startswith(GZIP_MAGIC[:len(chunk)]):
+                raise UploadError(400, "archive must be tar.gz")
+
+            size += len(chunk)
+            if size > max_size:
+                raise UploadError(413, "archive is too large")
+
+            digest.update(chunk)
+            buffer += chunk
+            if len(buffer) >= UPLOAD_CHUNK_SIZE:
+                await f.write(bytes(buffer))
+                buffer.clear()
+
+        if buffer:
+            await f.write(bytes(buffer))
+
+    if size < len(GZIP_MAGIC):
+        raise UploadError(400, "archive must be tar.gz")
+
+    return digest.hexdigest()
+
+def publish_archive(tmp_path: str, path: str) -> None:
+    # Жёсткая ссылка атомарно создаёт файл и не перезаписывает уже
+    # опубликованную версию: индекс увидит архив только целиком
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        os.link(tmp_path, path)
+    except FileExistsError:
+        raise
+    except OSError:
+        if os.path.exists(path):
+            raise FileExistsError(path)
+        os.replace(tmp_path, path)
+        return
+
+    os.remove(tmp_path)
@@ -1,45 +1,158 @@
+import hashlib
 import os
 
 UPDATE_DIR = "updates"
 UPDATE_FILE_EXT = ".tar.gz"
+DELTA_DIR = "deltas"
+DELTA_FILE_EXT = ".delta.tar.gz"
+DELTA_MANIFEST = ".delta.json"
+MANIFEST_DIR = "manifests"
+MANIFEST_FILE_EXT = ".json"
+BLOB_DIR = "blobs"
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+ROLLOUT_FILE = "rollout.json"
+CLIENT_ID_HEADER = "X-Client-Id"
+MAX_DOWNLOADS_PER_APP = 32
+RETRY_AFTER = 10
+MIRROR_CACHE_DIR = "mirror_cache"
+MIRROR_CACHE_MAX_SIZE = 10 * 1024 * 1024 * 1024
+UPLOAD_TMP_DIR = ".uploads"
+UPLOAD_MAX_SIZE = 4 * 1024 * 1024 * 1024
 
-def compare_version(version1: str, version2: str) -> int:
-    if not version1.strip():
-        return -1
-    if not version2.strip():
-        return 1
+def parse_version_key(version: str) -> tuple[int, ...]:
+    version = version.strip()
+    if not version:
+        return ()
+
+    key = list(map(int, version.split('.')))
+    while key and key[-1] == 0:
+        key.pop()
+
+    return tuple(key)
+
+class Version(str):
+    key: tuple[int, ...]
+
+    def __new__(cls, value: str = "") -> "Version":
+        if isinstance(value, Version):
+            return value
+
+        version = super().__new__(cls, value.strip())
+        version.key = parse_version_key(version)
+        return version
+
+    def __lt__(self, value: str) -> bool:
+        return self.key < Version(value).key
+
+    def __le__(self, value: str) -> bool:
+        return self.key <= Version(value).key
+
+    def __gt__(self, value: str) -> bool:
+        return self.key > Version(value).key
+
+    def __ge__(self, value: str) -> bool:
+        return self.key >= Version(value).key
 
-    v1 = version1.split('.')
-    v2 = version2.split('.')
+    # Равенство и хеш тоже по ключу: "1.0" и "1" - одна и та же версия.
+    # Поэтому словари с ключами Version нужно спрашивать через Version
+    def __eq__(self, value: object) -> bool:
+        if not isinstance(value, str):
+            return NotImplemented
+        try:
+            return self.key == Version(value).key
+        except ValueError:
+            return False
 
-    while len(v1) < len(v2):
-        v1.append('0')
-    while len(v2) < len(v1):
-        v2.append('0')
+    def __ne__(self, value: object) -> bool:
+        result = self.__eq__(value)
+        return result if result is NotImplemented else not result
 
-    for a, b in zip(v1, v2):
-        while len(a) < len(b):
-                a += '0'
-        while len(b) < len(a):
-            b += '0'
+    def __hash__(self) -> int:
+        return hash(self.key)
 
-        a, b = int(a), int(b)
-        if a < b:
-            return -1
-        if a > b:
-            return 1
+def version_key(version: str) -> tuple[int, ...]:
+    return Version(version).key
 
-    return 0
+def compare_version(version1: str, version2: str) -> int:
+    key1 = version_key(version1)
+    key2 = version_key(version2)
+    return (key1 > key2) - (key1 < key2)
 
 def get_higher_version(version1: str, version2: str) -> str:
-    cmp = compare_version(version1, version2)
-    if cmp > 0:
+    if version_key(version1) > version_key(version2):
         return version1
 
     return version2
 
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+def make_etag(value: str) -> str:
+    return f'"{value}"'
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip().removeprefix("W/")
+        if candidate == "*" or candidate == etag:
+            return True
+
+    return False
+
+def is_safe_name(name: str) -> bool:
+    # Имена с точки (".", "..", служебная ".uploads") не бывают приложениями и версиями
+    return bool(name) and not name.startswith(".") and name != UPLOAD_TMP_DIR and \
+        os.path.basename(name) == name
+
+def make_app_file_version_path(app: str, version: str) -> str:
+    return f"{UPDATE_DIR}/{app}/{version}{UPDATE_FILE_EXT}"
+
 def get_app_file_version_path(app: str, version: str) -> str | None:
-    file_path = f"{UPDATE_DIR}/{app}/{version}{UPDATE_FILE_EXT}"
+    file_path = make_app_file_version_path(app, version)
+    if not os.path.exists(file_path):
+        return None
+
+    return file_path
+
+def make_app_delta_path(app: str, from_version: str, version: str) -> str:
+    return f"{DELTA_DIR}/{app}/{from_version}-{version}{DELTA_FILE_EXT}"
+
+def get_app_delta_path(app: str, from_version: str, version: str) -> str | None:
+    file_path = make_app_delta_path(app, from_version, version)
+    if not os.path.exists(file_path):
+        return None
+
+    return file_path
+
+def make_app_manifest_path(app: str, version: str) -> str:
+    return f"{MANIFEST_DIR}/{app}/{version}{MANIFEST_FILE_EXT}"
+
+def get_app_manifest_path(app: str, version: str) -> str | None:
+    file_path = make_app_manifest_path(app, version)
+    if not os.path.exists(file_path):
+        return None
+
+    return file_path
+
+def is_blob_hash(blob_hash: str) -> bool:
+    return len(blob_hash) == 64 and all(c in "0123456789abcdef" for c in blob_hash)
+
+def make_blob_path(blob_hash: str) -> str:
+    return f"{BLOB_DIR}/{blob_hash[:2]}/{blob_hash}"
+
+def get_blob_path(blob_hash: str) -> str | None:
+    if not is_blob_hash(blob_hash):
+        return None
+
+    file_path = make_blob_path(blob_hash)
     if not os.path.exists(file_path):
         return None
 
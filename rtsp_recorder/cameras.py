@@ -0,0 +1,237 @@
+import json
+import os
+import threading
+import time
+
+from capture import STALL_TIMEOUT, CaptureSource
+from frame_queue import DROP_OLDEST
+from motion import MotionDetector, MotionGate
+from passthrough import PassthroughRecorder
+from recorder import Recorder
+from segments import SEGMENT_LENGTH
+from video_saver import VideoSaver
+
+RESTART_DELAY = 1.0
+RESTART_DELAY_MAX = 60.0
+ENCODE = "encode"
+PASSTHROUGH = "passthrough"
+RECORD_MODES = (ENCODE, PASSTHROUGH)
+
+class CameraConfig:
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        save_folder: os.PathLike,
+        *,
+        fps: int = 24,
+        queue_size: int = 64,
+        overflow_policy: str = DROP_OLDEST,
+        mode: str = ENCODE,
+        segment_length: int = SEGMENT_LENGTH,
+        motion: bool = False,
+        pre_roll: float = 3.0,
+        post_roll: float = 10.0,
+        motion_threshold: int = 25,
+        motion_min_area: float = 0.01,
+        stall_timeout: float = STALL_TIMEOUT,
+    ) -> None:
+        if not name or not url or not str(url).strip():
+            raise ValueError("Camera name and url must be set")
+        if mode not in RECORD_MODES:
+            raise ValueError(f"Unknown record mode: {mode}")
+
+        self.name = name
+        self.url = url
+        self.save_folder = save_folder
+        self.fps = fps
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.mode = mode
+        self.segment_length = segment_length
+        self.motion = motion
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.motion_threshold = motion_threshold
+        self.motion_min_area = motion_min_area
+        self.stall_timeout = stall_timeout
+
+    @classmethod
+    def from_dict(cls, data: dict, defaults: dict | None = None) -> "CameraConfig":
+        values = dict(defaults or {})
+        values.update(data)
+        return cls(
+            values["name"],
+            values["url"],
+            values.get("save_folder", os.path.join("./records/", values["name"])),
+            fps=int(values.get("fps", 24)),
+            queue_size=int(values.get("queue_size", 64)),
+            overflow_policy=values.get("overflow_policy", DROP_OLDEST),
+            mode=values.get("mode", ENCODE),
+            segment_length=int(values.get("segment_length", SEGMENT_LENGTH)),
+            motion=bool(values.get("motion", False)),
+            pre_roll=float(values.get("pre_roll", 3.0)),
+            post_roll=float(values.get("post_roll", 10.0)),
+            motion_threshold=int(values.get("motion_threshold", 25)),
+            motion_min_area=float(values.get("motion_min_area", 0.01)),
+            stall_timeout=float(values.get("stall_timeout", STALL_TIMEOUT)),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "url": self.url,
+            "save_folder": str(self.save_folder),
+            "fps": self.fps,
+            "queue_size": self.queue_size,
+            "overflow_policy": self.overflow_policy,
+            "mode": self.mode,
+            "segment_length": self.segment_length,
+            "motion": self.motion,
+            "pre_roll": self.pre_roll,
+            "post_roll": self.post_roll,
+            "motion_threshold": self.motion_threshold,
+            "motion_min_area": self.motion_min_area,
+            "stall_timeout": self.stall_timeout,
+        }
+
+def load_cameras(config_path: os.PathLike) -> list[CameraConfig]:
+    # {"defaults": {"fps": 15}, "cameras": [{"name": "hall", "url": "rtsp://..."}]}
+    with open(config_path, encoding="utf-8") as f:
+        config = json.load(f)
+
+    if isinstance(config, list):
+        config = {"cameras": config}
+
+    defaults = config.get("defaults", {})
+    cameras = [CameraConfig.from_dict(camera, defaults) for camera in config["cameras"]]
+    names = [camera.name for camera in cameras]
+    if len(names) != len(set(names)):
+        raise ValueError("Camera names must be unique")
+
+    return cameras
+
+class CameraSupervisor:
+    def __init__(self, config: CameraConfig, stop_event: threading.Event) -> None:
+        self.config = config
+        self.restarts = 0
+        self._stop_event = stop_event
+        self._recorder: Recorder | PassthroughRecorder | None = None
+        self._thread = threading.Thread(
+            target=self._run, name=f"camera-{config.name}", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def join(self, timeout: float | None = None) -> None:
+        self._thread.join(timeout)
+
+    def stats(self) -> dict[str, int]:
+        recorder = self._recorder
+        stats = recorder.stats() if recorder is not None else {}
+        stats["restarts"] = self.restarts
+        return stats
+
+    def _run(self) -> None:
+        delay = RESTART_DELAY
+        while not self._stop_event.is_set():
+            started = time.monotonic()
+            try:
+                self._record()
+            except Exception as e:
+                print(f"[{self.config.name}] Ошибка записи: {e!r}")
+
+            if self._stop_event.is_set():
+                break
+
+            # Камера, проработавшая долго, перезапускается сразу,
+            # а падающая раз за разом ждёт всё дольше
+            if time.monotonic() - started > RESTART_DELAY_MAX:
+                delay = RESTART_DELAY
+            self.restarts += 1
+            print(f"[{self.config.name}] Перезапуск через {delay:.0f} с")
+            self._stop_event.wait(delay)
+            delay = min(delay * 2, RESTART_DELAY_MAX)
+
+    def _record(self) -> None:
+        self._recorder = None
+        if self.config.mode == PASSTHROUGH:
+            self._recorder = PassthroughRecorder(
+                self.config.url,
+                self.config.save_folder,
+                segment_length=self.config.segment_length,
+            )
+            self._recorder.start()
+            try:
+                self._wait_recorder()
+            finally:
+                self._recorder.stop()
+            return
+
+        # Обрывы связи обрабатывает сам рекордер, сюда попадаем
+        # только если камера не открылась с первого раза или рекордер упал
+        source = CaptureSource(
+            self.config.url, stall_timeout=self.config.stall_timeout, name=self.config.name
+        )
+        video_saver = None
+        try:
+            if not source.camera.isOpened():
+                raise ConnectionError("camera is not opened")
+
+            video_saver = VideoSaver(
+                self.config.save_folder,
+                fps=self.config.fps,
+                camera=source.camera,
+                segment_length=self.config.segment_length,
+            )
+            self._recorder = Recorder(
+                source,
+                video_saver,
+                queue_size=self.config.queue_size,
+                overflow_policy=self.config.overflow_policy,
+                target_fps=self.config.fps,
+                motion_gate=self._create_motion_gate(video_saver.fps),
+                name=self.config.name,
+            )
+            self._recorder.start()
+            self._wait_recorder()
+        finally:
+            if self._recorder is not None:
+                self._recorder.stop()
+            source.release()
+            if video_saver is not None:
+                video_saver.release()
+
+    def _create_motion_gate(self, fps: float) -> MotionGate | None:
+        if not self.config.motion:
+            return None
+
+        detector = MotionDetector(
+            threshold=self.config.motion_threshold, min_area=self.config.motion_min_area
+        )
+        return MotionGate(
+            detector, int(self.config.pre_roll * fps), int(self.config.post_roll * fps)
+        )
+
+    def _wait_recorder(self) -> None:
+        while not self._stop_event.wait(0.5) and self._recorder.is_alive():
+            pass
+
+def run_cameras(
+    cameras: list[CameraConfig], stop_event: threading.Event, stats_interval: float = 60
+) -> None:
+    supervisors = [CameraSupervisor(camera, stop_event) for camera in cameras]
+    for supervisor in supervisors:
+        supervisor.start()
+
+    next_stats = time.monotonic() + stats_interval
+    while not stop_event.wait(0.5):
+        if time.monotonic() >= next_stats:
+            next_stats += stats_interval
+            for supervisor in supervisors:
+                stats = " ".join(f"{key}={value}" for key, value in supervisor.stats().items())
+                print(f"[{supervisor.config.name}] {stats}")
+
+    for supervisor in supervisors:
+        supervisor.join()
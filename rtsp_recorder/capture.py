@@ -0,0 +1,84 @@
+import threading
+import time
+
+import cv2
+
+STALL_TIMEOUT = 10.0
+RECONNECT_DELAY = 1.0
+RECONNECT_DELAY_MAX = 60.0
+READ_RETRY_DELAY = 0.1
+
+def open_capture(url: str, timeout: float = STALL_TIMEOUT) -> cv2.VideoCapture:
+    # Таймауты бэкенда не дают open() и read() зависнуть на замолчавшей камере
+    timeout_ms = int(timeout * 1000)
+    return cv2.VideoCapture(
+        url,
+        cv2.CAP_ANY,
+        [
+            cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms,
+            cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms,
+        ],
+    )
+
+class CaptureSource:
+    def __init__(
+        self,
+        url: str,
+        *,
+        stall_timeout: float = STALL_TIMEOUT,
+        reconnect_delay: float = RECONNECT_DELAY,
+        reconnect_delay_max: float = RECONNECT_DELAY_MAX,
+        name: str = "camera",
+    ) -> None:
+        if stall_timeout <= 0:
+            raise ValueError("Invalid parameters: stall_timeout below or equal 0")
+
+        self.url = url
+        self.name = name
+        self.stall_timeout = stall_timeout
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_delay_max = reconnect_delay_max
+        self.read_errors = 0
+        self.stalls = 0
+        self.reconnects = 0
+        self.camera = open_capture(url, stall_timeout)
+        self._last_frame_at = time.monotonic()
+
+    def read(self, stop_event: threading.Event) -> cv2.typing.MatLike | None:
+        # None - остановка или обрыв: камера закрылась либо кадров
+        # не было дольше stall_timeout
+        while not stop_event.is_set():
+            if self.camera.isOpened():
+                ret, frame = self.camera.read()
+                if ret:
+                    self._last_frame_at = time.monotonic()
+                    return frame
+                self.read_errors += 1
+
+            if not self.camera.isOpened() or \
+                    time.monotonic() - self._last_frame_at > self.stall_timeout:
+                self.stalls += 1
+                return None
+
+            # Ошибки чтения не должны крутить ядро вхолостую
+            stop_event.wait(READ_RETRY_DELAY)
+        return None
+
+    def reconnect(self, stop_event: threading.Event) -> bool:
+        self.camera.release()
+        delay = self.reconnect_delay
+        while not stop_event.wait(delay):
+            self.reconnects += 1
+            print(f"[{self.name}] Переподключение к камере")
+            self.camera = open_capture(self.url, self.stall_timeout)
+            if self.camera.isOpened():
+                self._last_frame_at = time.monotonic()
+                return True
+
+            self.camera.release()
+            delay = min(delay * 2, self.reconnect_delay_max)
+            print(f"[{self.name}] Камера недоступна, повтор через {delay:.0f} с")
+        return False
+
+    def release(self) -> None:
+        self.camera.release()
@@ -0,0 +1,77 @@
+import threading
+
+from collections import deque
+
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+OVERFLOW_POLICIES = (DROP_OLDEST, BLOCK)
+
+class FrameQueue:
+    def __init__(self, maxsize: int = 64, policy: str = DROP_OLDEST) -> None:
+        if maxsize < 1:
+            raise ValueError("Invalid parameters: maxsize below 1")
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self.total = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def put(self, item, timeout: float | None = None) -> bool:
+        with self._condition:
+            if self._closed:
+                return False
+
+            if len(self._items) >= self.maxsize:
+                if self.policy == DROP_OLDEST:
+                    self._items.popleft()
+                    self.dropped += 1
+                elif not self._condition.wait_for(
+                    lambda: self._closed or len(self._items) < self.maxsize, timeout
+                ) or self._closed:
+                    self.dropped += 1
+                    return False
+
+            self._items.append(item)
+            self.total += 1
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._condition.notify_all()
+            return True
+
+    def get(self, timeout: float | None = None):
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._closed or self._items, timeout
+            ) or not self._items:
+                return None
+
+            item = self._items.popleft()
+            self._condition.notify_all()
+            return item
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def depth(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> dict[str, int]:
+        with self._condition:
+            return {
+                "depth": len(self._items),
+                "max_depth": self.max_depth,
+                "total": self.total,
+                "dropped": self.dropped,
+            }
@@ -1,37 +1,91 @@
-import cv2
 import os
 import signal
+import threading
 
-from video_saver import VideoSaver
+from cameras import ENCODE, CameraConfig, load_cameras, run_cameras
+from capture import STALL_TIMEOUT
+from frame_queue import DROP_OLDEST
+from retention import RetentionManager
+from segments import SEGMENT_LENGTH
+from workers import WORKER_STOP_TIMEOUT, WorkerPool
 
-RUNNING = True
+RTSP_URL = os.getenv("RTSP_URL")
+SAVE_FOLDER = os.getenv("SAVE_FOLDER", "./records/")
+TARGET_FPS = int(os.getenv("TARGET_FPS", 24))
+QUEUE_SIZE = int(os.getenv("QUEUE_SIZE", 64))
+QUEUE_POLICY = os.getenv("QUEUE_POLICY", DROP_OLDEST)
+STATS_INTERVAL = float(os.getenv("STATS_INTERVAL", 60))
+CAMERAS_CONFIG = os.getenv("CAMERAS_CONFIG")
+WORKERS = int(os.getenv("WORKERS", 0))
+RECORD_MODE = os.getenv("RECORD_MODE", ENCODE)
+SEGMENT_LENGTH = int(os.getenv("SEGMENT_LENGTH", SEGMENT_LENGTH))
+MOTION_DETECTION = os.getenv("MOTION_DETECTION", "0") == "1"
+MOTION_PRE_ROLL = float(os.getenv("MOTION_PRE_ROLL", 3))
+MOTION_POST_ROLL = float(os.getenv("MOTION_POST_ROLL", 10))
+MOTION_THRESHOLD = int(os.getenv("MOTION_THRESHOLD", 25))
+MOTION_MIN_AREA = float(os.getenv("MOTION_MIN_AREA", 0.01))
+STALL_TIMEOUT = float(os.getenv("STALL_TIMEOUT", STALL_TIMEOUT))
+RETENTION_DAYS = float(os.getenv("RETENTION_DAYS", 0))
+RETENTION_MAX_SIZE_GB = float(os.getenv("RETENTION_MAX_SIZE_GB", 0))
+RETENTION_MIN_FREE_GB = float(os.getenv("RETENTION_MIN_FREE_GB", 0))
+WORKER_STOP_TIMEOUT = float(os.getenv("WORKER_STOP_TIMEOUT", WORKER_STOP_TIMEOUT))
+
+STOP_EVENT = threading.Event()
 
 def signal_handler(signal, frame) -> None:
-    global RUNNING
-    RUNNING = False
+    STOP_EVENT.set()
 
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
+def start_retention(folders: list[os.PathLike]) -> None:
+    # Старые записи удаляются в основном процессе, а не в процессах камер
+    retention = RetentionManager(
+        folders,
+        STOP_EVENT,
+        max_age=RETENTION_DAYS * 24 * 3600,
+        max_size=int(RETENTION_MAX_SIZE_GB * 1024 ** 3),
+        min_free=int(RETENTION_MIN_FREE_GB * 1024 ** 3),
+    )
+    if retention.enabled:
+        retention.start()
 
-RTSP_URL = os.getenv("RTSP_URL")
-SAVE_FOLDER = os.getenv("SAVE_FOLDER", "./records/")
-TARGER_FPS = int(os.getenv("TARGET_FPS", 24))
-
-if not RTSP_URL.strip():
-    raise ValueError("RTSP_URL is not set")
-
-CAMERA = cv2.VideoCapture(RTSP_URL)
-VIDEO_SAVER = VideoSaver(SAVE_FOLDER, fps=24, camera=CAMERA)
-
-try:
-    while RUNNING and CAMERA.isOpened():
-        ret, frame = CAMERA.read()
-        if not ret:
-            continue
-
-        VIDEO_SAVER.save(frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-finally:
-    CAMERA.release()
-    VIDEO_SAVER.release()
+def run_single() -> None:
+    if not RTSP_URL or not RTSP_URL.strip():
+        raise ValueError("RTSP_URL is not set")
+
+    camera = CameraConfig(
+        "camera",
+        RTSP_URL,
+        SAVE_FOLDER,
+        fps=TARGET_FPS,
+        queue_size=QUEUE_SIZE,
+        overflow_policy=QUEUE_POLICY,
+        mode=RECORD_MODE,
+        segment_length=SEGMENT_LENGTH,
+        motion=MOTION_DETECTION,
+        pre_roll=MOTION_PRE_ROLL,
+        post_roll=MOTION_POST_ROLL,
+        motion_threshold=MOTION_THRESHOLD,
+        motion_min_area=MOTION_MIN_AREA,
+        stall_timeout=STALL_TIMEOUT,
+    )
+    start_retention([camera.save_folder])
+    run_cameras([camera], STOP_EVENT, STATS_INTERVAL)
+
+def run_multi(config_path: str) -> None:
+    cameras = load_cameras(config_path)
+    start_retention([camera.save_folder for camera in cameras])
+    pool = WorkerPool(cameras, WORKERS, STATS_INTERVAL)
+    pool.start()
+    try:
+        while not STOP_EVENT.wait(1):
+            pool.supervise()
+    finally:
+        pool.stop(WORKER_STOP_TIMEOUT)
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    if CAMERAS_CONFIG:
+        run_multi(CAMERAS_CONFIG)
+    else:
+        run_single()
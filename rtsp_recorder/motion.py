@@ -0,0 +1,86 @@
+from collections import deque
+
+import numpy as np
+
+DETECTION_WIDTH = 160
+# Веса каналов BGR для перевода в яркость, в сумме 256
+GRAY_WEIGHTS = np.array([29, 150, 77], dtype=np.uint16)
+
+class MotionDetector:
+    def __init__(
+        self,
+        *,
+        threshold: int = 25,
+        min_area: float = 0.01,
+        width: int = DETECTION_WIDTH,
+        background_rate: float = 0.05,
+    ) -> None:
+        self.threshold = threshold
+        self.min_area = min_area
+        self.width = width
+        self.background_rate = background_rate
+        self.level = 0.0
+        self._background: np.ndarray | None = None
+
+    def _prepare(self, frame: np.ndarray) -> np.ndarray:
+        # Уменьшаем прореживанием без копирования, затем переводим в оттенки серого
+        step = max(frame.shape[1] // self.width, 1)
+        small = frame[::step, ::step]
+        if small.ndim == 3:
+            small = (small @ GRAY_WEIGHTS[:small.shape[2]]) >> 8
+        return small.astype(np.float32)
+
+    def detect(self, frame: np.ndarray) -> bool:
+        gray = self._prepare(frame)
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray
+            return False
+
+        difference = np.abs(gray - self._background)
+        self.level = np.count_nonzero(difference > self.threshold) / difference.size
+        # Фон медленно подстраивается под освещение и мелкие изменения сцены
+        self._background += self.background_rate * (gray - self._background)
+        return self.level >= self.min_area
+
+    def reset(self) -> None:
+        self._background = None
+        self.level = 0.0
+
+class MotionGate:
+    def __init__(
+        self, detector: MotionDetector, pre_roll_frames: int, post_roll_frames: int
+    ) -> None:
+        self.detector = detector
+        self.post_roll_frames = post_roll_frames
+        self.active = False
+        self.events = 0
+        self._pre_roll = deque(maxlen=max(pre_roll_frames, 1))
+        self._remaining = 0
+
+    def push(self, item: tuple, frame: np.ndarray) -> list[tuple]:
+        # Возвращает кадры, которые нужно записать
+        if self.detector.detect(frame):
+            self._remaining = self.post_roll_frames
+            if not self.active:
+                self.active = True
+                self.events += 1
+                items = list(self._pre_roll)
+                self._pre_roll.clear()
+                items.append(item)
+                return items
+            return [item]
+
+        if self.active:
+            self._remaining -= 1
+            if self._remaining <= 0:
+                self.active = False
+            return [item]
+
+        self._pre_roll.append(item)
+        return []
+
+    def reset(self) -> None:
+        self.detector.reset()
+        self._pre_roll.clear()
+        self.active = False
+        self._remaining = 0
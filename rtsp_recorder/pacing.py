@@ -0,0 +1,36 @@
+MAX_GAP = 5.0
+
+class FramePacer:
+    def __init__(self, target_fps: float) -> None:
+        if target_fps <= 0:
+            raise ValueError("Invalid parameters: target_fps below or equal 0")
+
+        self.interval = 1 / target_fps
+        self.dropped = 0
+        self.duplicated = 0
+        self._next_slot: float | None = None
+        self._last: float | None = None
+
+    def reset(self) -> None:
+        self._next_slot = None
+        self._last = None
+
+    def schedule(self, timestamp: float) -> int | None:
+        # None - кадр лишний; иначе сколько раз перед ним повторить предыдущий,
+        # чтобы заполнить пропущенные интервалы
+        if self._next_slot is None or timestamp < self._last or \
+                timestamp - self._last > MAX_GAP:
+            # Первый кадр, перезапуск потока или долгий обрыв: начинаем отсчёт заново
+            self._next_slot = timestamp + self.interval
+            self._last = timestamp
+            return 0
+
+        self._last = timestamp
+        if timestamp < self._next_slot - self.interval / 2:
+            self.dropped += 1
+            return None
+
+        missing = int((timestamp - self._next_slot) / self.interval + 0.5)
+        self._next_slot += (missing + 1) * self.interval
+        self.duplicated += missing
+        return missing
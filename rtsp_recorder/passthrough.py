@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+
+from datetime import datetime
+from pathlib import Path
+
+import av
+
+from segments import SEGMENT_LENGTH, SegmentSchedule, mark_closed, mark_open
+from video_saver import get_save_file_path
+
+OPEN_TIMEOUT = 10.0
+READ_TIMEOUT = 10.0
+
+class PassthroughRecorder:
+    def __init__(
+        self, url: str, save_folder: os.PathLike, *, segment_length: int = SEGMENT_LENGTH
+    ) -> None:
+        self.url = url
+        self.save_folder = save_folder
+        self.schedule = SegmentSchedule(segment_length)
+        self.current_file_name: Path | None = None
+        self.packets = 0
+        self.segments = 0
+        self.skipped = 0
+        self._output = None
+        self._output_stream = None
+        self._offset = 0
+        self._deadline = 0.0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="passthrough", daemon=True)
+
+        if not os.path.exists(self.save_folder):
+            os.makedirs(self.save_folder)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop_event.set()
+        self._thread.join(timeout)
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "packets": self.packets,
+            "segments": self.segments,
+            "skipped": self.skipped,
+        }
+
+    def _run(self) -> None:
+        options = {"rtsp_transport": "tcp"} if self.url.startswith("rtsp") else {}
+        try:
+            with av.open(
+                self.url, options=options, timeout=(OPEN_TIMEOUT, READ_TIMEOUT)
+            ) as source:
+                stream = source.streams.video[0]
+                for packet in source.demux(stream):
+                    if self._stop_event.is_set():
+                        break
+                    if packet.dts is None:
+                        continue
+
+                    # Сегмент можно начать только с ключевого кадра
+                    if packet.is_keyframe and (
+                        self._output is None or time.time() >= self._deadline
+                    ):
+                        self._open_segment(stream, packet.dts)
+
+                    if self._output is None:
+                        self.skipped += 1
+                        continue
+
+                    packet.dts -= self._offset
+                    if packet.pts is not None:
+                        packet.pts -= self._offset
+                    packet.stream = self._output_stream
+                    self._output.mux(packet)
+                    self.packets += 1
+        finally:
+            self._close_segment()
+
+    def _open_segment(self, stream, offset: int) -> None:
+        self._close_segment()
+
+        start, self._deadline = self.schedule.get_bounds()
+        self.current_file_name = get_save_file_path(
+            self.save_folder,
+            self.current_file_name,
+            datetime.fromtimestamp(start),
+            self.schedule.segment_length,
+        )
+        mark_open(self.current_file_name)
+        try:
+            self._output = av.open(str(self.current_file_name), "w", format="mp4")
+        except Exception:
+            mark_closed(self.current_file_name)
+            raise
+        if hasattr(self._output, "add_stream_from_template"):
+            self._output_stream = self._output.add_stream_from_template(stream)
+        else:
+            self._output_stream = self._output.add_stream(template=stream)
+        self._offset = offset
+        self.segments += 1
+
+    def _close_segment(self) -> None:
+        if self._output is not None:
+            try:
+                self._output.close()
+            finally:
+                self._output = None
+                self._output_stream = None
+                mark_closed(self.current_file_name)
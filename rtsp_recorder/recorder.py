@@ -0,0 +1,197 @@
+import threading
+import time
+
+from datetime import datetime
+
+import cv2
+
+from capture import CaptureSource
+from frame_queue import DROP_OLDEST, FrameQueue
+from motion import MotionGate
+from pacing import FramePacer
+from video_saver import VideoSaver
+
+QUEUE_WAIT_TIMEOUT = 0.5
+
+class Recorder:
+    def __init__(
+        self,
+        source: CaptureSource,
+        video_saver: VideoSaver,
+        *,
+        queue_size: int = 64,
+        overflow_policy: str = DROP_OLDEST,
+        target_fps: float = 0,
+        motion_gate: MotionGate | None = None,
+        name: str = "camera",
+    ) -> None:
+        self.name = name
+        self.source = source
+        self.video_saver = video_saver
+        self.queue = FrameQueue(queue_size, overflow_policy)
+        self.pacer = FramePacer(target_fps) if target_fps > 0 else None
+        self.motion_gate = motion_gate
+        self._motion_started: datetime | None = None
+        # Источник времени кадров выбирается по первым кадрам подключения
+        self._use_position: bool | None = None
+        self._first_position: float | None = None
+        self.captured = 0
+        self.written = 0
+        self._stop_event = threading.Event()
+        self._capture_thread = threading.Thread(
+            target=self._capture_loop, name="capture", daemon=True
+        )
+        self._write_thread = threading.Thread(
+            target=self._write_loop, name="write", daemon=True
+        )
+
+    def start(self) -> None:
+        self._capture_thread.start()
+        self._write_thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop_event.set()
+        self._capture_thread.join(timeout)
+        self.queue.close()
+        self._write_thread.join(timeout)
+
+    def is_alive(self) -> bool:
+        # Рекордер без любого из потоков не пишет: супервизор должен его перезапустить
+        return self._capture_thread.is_alive() and self._write_thread.is_alive()
+
+    def stats(self) -> dict[str, int]:
+        queue_stats = self.queue.stats()
+        return {
+            "captured": self.captured,
+            "written": self.written,
+            "read_errors": self.source.read_errors,
+            "stalls": self.source.stalls,
+            "reconnects": self.source.reconnects,
+            "queue_depth": queue_stats["depth"],
+            "queue_max_depth": queue_stats["max_depth"],
+            "dropped": queue_stats["dropped"],
+            "paced_dropped": self.pacer.dropped if self.pacer is not None else 0,
+            "duplicated": self.pacer.duplicated if self.pacer is not None else 0,
+            "motion_events": self.motion_gate.events if self.motion_gate is not None else 0,
+        }
+
+    def _capture_loop(self) -> None:
+        try:
+            while not self._stop_event.is_set():
+                frame = self.source.read(self._stop_event)
+                if frame is None:
+                    if self._stop_event.is_set():
+                        break
+                    # Обрыв: писатель закрывает сегмент, а поток захвата
+                    # переподключается, не дожидаясь перезапуска всего рекордера
+                    print(f"[{self.name}] Нет кадров от камеры, сегмент закрыт")
+                    # Метка обрыва не должна теряться и при полной очереди,
+                    # иначе сегмент останется открытым
+                    while not self.queue.put((0, None), timeout=QUEUE_WAIT_TIMEOUT):
+                        if self._stop_event.is_set() or self.queue.closed:
+                            break
+                    if not self.source.reconnect(self._stop_event):
+                        break
+                    if self.pacer is not None:
+                        self.pacer.reset()
+                    self._use_position = None
+                    self._first_position = None
+                    continue
+
+                self.captured += 1
+                duplicates = 0
+                if self.pacer is not None:
+                    # Лишние кадры отбрасываются до очереди и не кодируются
+                    duplicates = self.pacer.schedule(self._get_timestamp())
+                    if duplicates is None:
+                        continue
+
+                self.queue.put((duplicates, frame), timeout=QUEUE_WAIT_TIMEOUT)
+        finally:
+            self.queue.close()
+
+    def _get_timestamp(self) -> float:
+        # Время кадра из потока точнее времени его получения, но смешивать
+        # их нельзя: у них разные точки отсчёта. Поток, у которого время
+        # растёт уже на втором кадре, идёт по своему времени до обрыва,
+        # остальные - по времени получения
+        position = self.source.camera.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        if self._use_position is None:
+            if self._first_position is None:
+                self._first_position = position
+                return position
+
+            self._use_position = position > self._first_position
+            if not self._use_position:
+                self.pacer.reset()
+
+        if self._use_position:
+            return position
+        return time.monotonic()
+
+    def _write_loop(self) -> None:
+        try:
+            self._write_frames()
+        except Exception as e:
+            print(f"[{self.name}] Ошибка записи: {e!r}")
+        finally:
+            # Без писателя останавливаем и захват, иначе очередь некому разбирать
+            self._stop_event.set()
+            self.queue.close()
+
+    def _write_frames(self) -> None:
+        last_frame = None
+        while True:
+            item = self.queue.get(timeout=QUEUE_WAIT_TIMEOUT)
+            if item is None:
+                if self.queue.closed:
+                    break
+                continue
+
+            if item[1] is None:
+                self._close_segment()
+                last_frame = None
+                continue
+
+            items = [item]
+            if self.motion_gate is not None:
+                items, started = self._gate(item)
+                if started:
+                    # Запись после простоя: кадр до простоя не повторяем
+                    last_frame = None
+
+            for duplicates, frame in items:
+                if last_frame is not None:
+                    for _ in range(duplicates):
+                        self.video_saver.save(last_frame)
+                        self.written += 1
+
+                self.video_saver.save(frame)
+                self.written += 1
+                last_frame = frame
+
+    def _gate(self, item: tuple) -> tuple[list[tuple], bool]:
+        was_active = self.motion_gate.active
+        items = self.motion_gate.push(item, item[1])
+        started = not was_active and self.motion_gate.active
+        if started:
+            self._motion_started = datetime.now()
+            print(f"[{self.name}] {self._motion_started:%Y-%m-%d %H:%M:%S} Движение началось")
+        elif was_active and not self.motion_gate.active:
+            self._log_motion_end()
+        return items, started
+
+    def _log_motion_end(self) -> None:
+        duration = (datetime.now() - self._motion_started).total_seconds()
+        print(
+            f"[{self.name}] {datetime.now():%Y-%m-%d %H:%M:%S} "
+            f"Движение закончилось, длительность {duration:.0f} с"
+        )
+
+    def _close_segment(self) -> None:
+        # Следующий кадр после переподключения откроет новый сегмент
+        self.video_saver.release()
+        if self.motion_gate is not None:
+            if self.motion_gate.active:
+                self._log_motion_end()
+            self.motion_gate.reset()
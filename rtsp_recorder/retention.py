@@ -0,0 +1,230 @@
+import bisect
+import os
+import shutil
+import threading
+import time
+
+from pathlib import Path
+
+from segments import OPEN_MARKER_SUFFIX, is_open, mark_closed
+
+SEGMENT_SUFFIX = ".mp4"
+RETENTION_INTERVAL = 60.0
+DELETE_DELAY = 0.5
+LOW_PRIORITY = 19
+
+class SegmentIndex:
+    def __init__(self, folder: os.PathLike) -> None:
+        self.folder = Path(folder)
+        self.size = 0
+        # (mtime, имя) по возрастанию: в начале самые старые сегменты
+        self._files: list[tuple[float, str]] = []
+        self._entries: dict[str, tuple[float, int]] = {}
+        self._folder_mtime: int | None = None
+        # Сегменты, которые на прошлом проходе ещё писались: их размер
+        # перечитывается, пока они не закроются
+        self._open: set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def oldest(self, skip: set[str] = frozenset()) -> tuple[float, str] | None:
+        for entry in self._files:
+            if entry[1] not in skip:
+                return entry
+        return None
+
+    def refresh(self) -> None:
+        # Папка перечитывается только если в ней появились или пропали файлы
+        # (в том числе метки открытых сегментов), и stat делается только для
+        # новых; иначе обновляются лишь размеры сегментов, которые ещё пишутся
+        try:
+            folder_mtime = os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            return
+
+        if folder_mtime != self._folder_mtime:
+            self._folder_mtime = folder_mtime
+            self._rescan()
+        else:
+            self._update_open()
+
+    def _rescan(self) -> None:
+        names = set()
+        markers = set()
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.name.endswith(OPEN_MARKER_SUFFIX):
+                    markers.add(entry.name.removesuffix(OPEN_MARKER_SUFFIX))
+                    continue
+                if not entry.name.endswith(SEGMENT_SUFFIX) or not entry.is_file():
+                    continue
+                names.add(entry.name)
+                if entry.name not in self._entries:
+                    self._add(entry.name, entry.stat())
+
+        for name in self._entries.keys() - names:
+            self._forget(name)
+
+        # Закрытые с прошлого прохода сегменты перечитываются последний раз,
+        # чтобы в индекс попал их окончательный размер
+        closed = self._open - markers
+        self._open = markers & names
+        self._update_open(closed)
+
+    def _update_open(self, closed: set[str] = frozenset()) -> None:
+        if self._files:
+            # Последний сегмент считаем открытым и без метки
+            self._open.add(self._files[-1][1])
+
+        for name in self._open | closed:
+            if name in self._entries:
+                self._forget(name)
+                self._add(name)
+
+    def _add(self, name: str, stat: os.stat_result | None = None) -> None:
+        try:
+            stat = stat or os.stat(self.folder / name)
+        except FileNotFoundError:
+            return
+
+        self._entries[name] = (stat.st_mtime, stat.st_size)
+        bisect.insort(self._files, (stat.st_mtime, name))
+        self.size += stat.st_size
+
+    def _forget(self, name: str) -> int:
+        entry = self._entries.pop(name, None)
+        if entry is None:
+            return 0
+
+        mtime, size = entry
+        index = bisect.bisect_left(self._files, (mtime, name))
+        del self._files[index]
+        self.size -= size
+        return size
+
+    def is_open(self, name: str) -> bool:
+        return is_open(self.folder / name)
+
+    def remove(self, name: str) -> int | None:
+        try:
+            (self.folder / name).unlink(missing_ok=True)
+        except OSError as e:
+            # Файл забываем до следующего перечитывания папки, иначе
+            # очистка упиралась бы в него на каждом проходе
+            print(f"Не удалось удалить запись {self.folder / name}: {e!r}")
+            self._forget(name)
+            return None
+
+        # Метка, оставшаяся от упавшего процесса записи, больше не нужна
+        mark_closed(self.folder / name)
+        return self._forget(name)
+
+class RetentionManager:
+    def __init__(
+        self,
+        folders: list[os.PathLike],
+        stop_event: threading.Event,
+        *,
+        max_age: float = 0,
+        max_size: int = 0,
+        min_free: int = 0,
+        interval: float = RETENTION_INTERVAL,
+        delete_delay: float = DELETE_DELAY,
+    ) -> None:
+        if max_age < 0 or max_size < 0 or min_free < 0:
+            raise ValueError("Invalid parameters: max_age, max_size or min_free below 0")
+
+        self.max_age = max_age
+        self.max_size = max_size
+        self.min_free = min_free
+        self.interval = interval
+        self.delete_delay = delete_delay
+        self.deleted = 0
+        self.freed = 0
+        self._indexes = [SegmentIndex(folder) for folder in dict.fromkeys(map(str, folders))]
+        self._stop_event = stop_event
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_age > 0 or self.max_size > 0 or self.min_free > 0
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def join(self, timeout: float | None = None) -> None:
+        self._thread.join(timeout)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "segments": sum(len(index) for index in self._indexes),
+            "size": sum(index.size for index in self._indexes),
+            "deleted": self.deleted,
+            "freed": self.freed,
+        }
+
+    def _run(self) -> None:
+        # Поток удаления не должен мешать записи: на Linux приоритет nice
+        # выставляется для отдельного потока, от него же зависит приоритет
+        # ввода-вывода у планировщиков CFQ/BFQ
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), LOW_PRIORITY)
+        except (AttributeError, OSError):
+            pass
+
+        while not self._stop_event.is_set():
+            try:
+                self.apply()
+            except Exception as e:
+                print(f"Ошибка очистки записей: {e!r}")
+            self._stop_event.wait(self.interval)
+
+    def apply(self) -> None:
+        for index in self._indexes:
+            index.refresh()
+
+        deleted = 0
+        freed = 0
+        # Открытые на запись сегменты (текущий, заранее открытый следующий и ещё
+        # не закрытый предыдущий) помечены процессом записи, их пропускаем
+        skipped = {index: set() for index in self._indexes}
+        while not self._stop_event.is_set():
+            # Самый старый сегмент среди всех папок
+            candidates = [
+                (entry, index) for index in self._indexes
+                if (entry := index.oldest(skipped[index])) is not None
+            ]
+            if not candidates:
+                break
+
+            (mtime, name), index = min(candidates, key=lambda candidate: candidate[0])
+            if not self._is_expired(mtime) and not self._is_over_quota(index.folder):
+                break
+
+            if index.is_open(name):
+                skipped[index].add(name)
+                continue
+
+            size = index.remove(name)
+            if size is None:
+                continue
+            deleted += 1
+            freed += size
+            # Удаления растягиваются во времени, чтобы не забивать диск
+            self._stop_event.wait(self.delete_delay)
+
+        if deleted:
+            self.deleted += deleted
+            self.freed += freed
+            print(f"Удалено старых записей: {deleted}, освобождено {freed / 1024 ** 2:.0f} МБ")
+
+    def _is_expired(self, mtime: float) -> bool:
+        return self.max_age > 0 and time.time() - mtime > self.max_age
+
+    def _is_over_quota(self, folder: Path) -> bool:
+        if self.max_size > 0 and sum(index.size for index in self._indexes) > self.max_size:
+            return True
+        if self.min_free > 0:
+            return shutil.disk_usage(folder).free < self.min_free
+        return False
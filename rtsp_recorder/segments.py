@@ -0,0 +1,70 @@
+import os
+import time
+
+from datetime import datetime, timedelta
+
+SEGMENT_LENGTH = 3600
+OPEN_MARKER_SUFFIX = ".open"
+
+class SegmentSchedule:
+    def __init__(self, segment_length: int = SEGMENT_LENGTH) -> None:
+        if segment_length < 1:
+            raise ValueError("Invalid parameters: segment_length below 1")
+
+        self.segment_length = segment_length
+
+    def get_bounds(self, now: float | None = None) -> tuple[float, float]:
+        # Сегменты выровнены по местной полуночи: при длине в час
+        # границы совпадают с началом каждого часа
+        if now is None:
+            now = time.time()
+
+        day = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        day_start = day.timestamp()
+        next_day_start = (day + timedelta(days=1)).timestamp()
+        index = int((now - day_start) // self.segment_length)
+        start = day_start + index * self.segment_length
+        return start, min(start + self.segment_length, next_day_start)
+
+    def get_file_date_format(self) -> str:
+        if self.segment_length % 3600 == 0:
+            return "%Y-%m-%d_%H"
+        if self.segment_length % 60 == 0:
+            return "%Y-%m-%d_%H-%M"
+        return "%Y-%m-%d_%H-%M-%S"
+
+def _get_marker_path(path: os.PathLike) -> str:
+    return f"{path}{OPEN_MARKER_SUFFIX}"
+
+def mark_open(path: os.PathLike) -> None:
+    # Рядом с открытым сегментом лежит метка с pid процесса записи: очистка
+    # старых записей работает в другом процессе и такой файл не трогает
+    with open(_get_marker_path(path), "w") as f:
+        f.write(str(os.getpid()))
+
+def mark_closed(path: os.PathLike) -> None:
+    try:
+        os.remove(_get_marker_path(path))
+    except FileNotFoundError:
+        pass
+
+def is_open(path: os.PathLike) -> bool:
+    try:
+        with open(_get_marker_path(path)) as f:
+            pid = int(f.read())
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError):
+        # Метку только что создали или её не прочитать: считаем файл открытым
+        return True
+
+    # Метка упавшего процесса записи не должна защищать файл вечно
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
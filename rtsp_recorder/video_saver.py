@@ -1,8 +1,32 @@
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
 import cv2
 import os
+import time
+
+from segments import SEGMENT_LENGTH, SegmentSchedule, mark_closed, mark_open
+
+PREOPEN_AHEAD = 5.0
+
+def get_save_file_path(
+    save_folder: os.PathLike,
+    current_file_name: Path | None = None,
+    start: datetime | None = None,
+    segment_length: int = SEGMENT_LENGTH,
+) -> Path:
+    if start is None:
+        start = datetime.now()
+    file_date = start.strftime(SegmentSchedule(segment_length).get_file_date_format())
+    file_path = Path(save_folder) / f"{file_date}.mp4"
+    copy_number = 0
+    while file_path.exists() and file_path != current_file_name:
+        copy_number += 1
+        file_path = (
+            Path(save_folder) / f"{file_date}(copy {copy_number}).mp4"
+        )
+    return file_path
 
 class VideoSaver:
     def __init__(
@@ -13,11 +37,17 @@ class VideoSaver:
         width: int = 0,
         height: int = 0,
         camera: cv2.VideoCapture = None,
+        segment_length: int = SEGMENT_LENGTH,
     ) -> None:
         self.save_folder = save_folder
         self._writer: cv2.VideoWriter = None
+        self._next: Future | None = None
+        self._helper = ThreadPoolExecutor(max_workers=1, thread_name_prefix="segments")
         self.current_file_name = None
         self.codec = cv2.VideoWriter.fourcc(*"mp4v")
+        self.schedule = SegmentSchedule(segment_length)
+        self._deadline = 0.0
+        self._preopen_at = 0.0
 
         if camera is not None:
             self.fps = camera.get(cv2.CAP_PROP_FPS)
@@ -36,44 +66,122 @@ class VideoSaver:
 
         if not os.path.exists(self.save_folder):
             os.makedirs(self.save_folder)
+        # Файл открывается первым кадром: при записи по движению
+        # без движения не остаётся пустых сегментов
+
+    def _get_save_file_path(self, start: float | None = None) -> Path:
+        return get_save_file_path(
+            self.save_folder,
+            self.current_file_name,
+            datetime.fromtimestamp(start) if start is not None else None,
+            self.schedule.segment_length,
+        )
 
-        self.init_new_writer()
-
-    def _get_save_file_path(self) -> Path:
-        day_today = datetime.now().strftime("%Y-%m-%d")
-        hour_now = datetime.now().strftime("%H")
-        file_date = f"{day_today}_{hour_now}"
-        file_path = Path(self.save_folder) / f"{file_date}.mp4"
-        copy_number = 0
-        while file_path.exists() and file_path != self.current_file_name:
-            copy_number += 1
-            file_path = (
-                Path(self.save_folder) / f"{file_date}(copy {copy_number}).mp4"
+    def _open_writer(self, file_name: Path) -> cv2.VideoWriter:
+        mark_open(file_name)
+        try:
+            return cv2.VideoWriter(
+                filename=str(file_name),
+                fourcc=self.codec,
+                fps=self.fps,
+                frameSize=(self.width, self.height),
             )
-        return file_path
+        except Exception:
+            mark_closed(file_name)
+            raise
+
+    def _close_writer(self, writer: cv2.VideoWriter, file_name: Path) -> None:
+        writer.release()
+        mark_closed(file_name)
 
     def init_new_writer(self) -> None:
         self.release()
 
-        self.current_file_name = self._get_save_file_path()
-        self._writer = cv2.VideoWriter(
-            filename=str(self.current_file_name),
-            fourcc=self.codec,
-            fps=self.fps,
-            frameSize=(self.width, self.height),
-        )
+        start, self._deadline = self.schedule.get_bounds()
+        self._preopen_at = self._deadline - PREOPEN_AHEAD
+        self.current_file_name = self._get_save_file_path(start)
+        self._writer = self._open_writer(self.current_file_name)
 
     def save(self, frame: cv2.typing.MatLike) -> None:
-        current_file_name = self._get_save_file_path()
-        if current_file_name != self.current_file_name:
+        height, width = frame.shape[:2]
+        if self._writer is None or (width, height) != (self.width, self.height):
+            # Первый кадр, сегмент был закрыт при обрыве связи или камера
+            # после переподключения отдаёт кадры другого размера
+            self.width, self.height = width, height
             self.init_new_writer()
+            self._writer.write(frame)
+            return
+
+        now = time.time()
+        if now >= self._deadline:
+            self._rollover()
+        elif now >= self._preopen_at and self._next is None:
+            self._preopen_next()
 
         self._writer.write(frame)
 
+    def _preopen_next(self) -> None:
+        # Следующий файл открывается заранее во вспомогательном потоке,
+        # чтобы смена сегмента не останавливала запись кадров
+        deadline = self._deadline
+
+        def open_next() -> tuple[Path, float, cv2.VideoWriter]:
+            start, next_deadline = self.schedule.get_bounds(deadline)
+            file_name = self._get_save_file_path(start)
+            return file_name, next_deadline, self._open_writer(file_name)
+
+        self._next = self._helper.submit(open_next)
+
+    def _rollover(self) -> None:
+        if self._next is None:
+            self._preopen_next()
+
+        future, self._next = self._next, None
+        try:
+            file_name, deadline, writer = future.result()
+        except Exception:
+            self.init_new_writer()
+            return
+
+        if time.time() >= deadline:
+            # Кадров не было дольше сегмента: заготовка устарела
+            self._helper.submit(self._discard, writer, file_name)
+            self.init_new_writer()
+            return
+
+        previous, previous_name = self._writer, self.current_file_name
+        self._writer = writer
+        self.current_file_name = file_name
+        self._deadline = deadline
+        self._preopen_at = deadline - PREOPEN_AHEAD
+        if previous is not None:
+            self._helper.submit(self._close_writer, previous, previous_name)
+
+    def _discard(self, writer: cv2.VideoWriter, file_name: Path) -> None:
+        writer.release()
+        file_name.unlink(missing_ok=True)
+        mark_closed(file_name)
+
     def release(self) -> None:
-        if self._writer is not None and self._writer.isOpened():
-            self._writer.release()
+        if self._next is not None:
+            future, self._next = self._next, None
+            try:
+                file_name, _, writer = future.result()
+                self._helper.submit(self._discard, writer, file_name)
+            except Exception:
+                pass
+
+        if self._writer is not None:
+            self._close_writer(self._writer, self.current_file_name)
             self._writer = None
+        self.current_file_name = None
+
+        # Дожидаемся закрытия предыдущих сегментов во вспомогательном потоке
+        try:
+            self._helper.submit(lambda: None).result()
+        except RuntimeError:
+            pass
 
     def __del__(self) -> None:
         self.release()
+        self._helper.shutdown(wait=False)
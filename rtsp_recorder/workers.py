@@ -0,0 +1,82 @@
+import multiprocessing
+import os
+import signal
+import time
+
+from cameras import CameraConfig, run_cameras
+
+WORKER_RESTART_DELAY = 5.0
+WORKER_STOP_TIMEOUT = 10.0
+
+def partition_cameras(cameras: list[CameraConfig], workers: int) -> list[list[CameraConfig]]:
+    workers = max(min(workers, len(cameras)), 1)
+    groups = [list() for _ in range(workers)]
+    for index, camera in enumerate(cameras):
+        groups[index % workers].append(camera)
+
+    return groups
+
+def _worker_main(cameras: list[dict], stop_event, stats_interval: float) -> None:
+    # Остановкой управляет родительский процесс через stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    run_cameras(
+        [CameraConfig.from_dict(camera) for camera in cameras], stop_event, stats_interval
+    )
+
+class WorkerPool:
+    def __init__(
+        self,
+        cameras: list[CameraConfig],
+        workers: int = 0,
+        stats_interval: float = 60,
+    ) -> None:
+        self._context = multiprocessing.get_context("spawn")
+        self._stop_event = self._context.Event()
+        self._stats_interval = stats_interval
+        self._groups = partition_cameras(cameras, workers or os.cpu_count() or 1)
+        self._processes: list[multiprocessing.Process | None] = [None] * len(self._groups)
+        self._restart_at: list[float] = [0.0] * len(self._groups)
+
+    def start(self) -> None:
+        for index in range(len(self._groups)):
+            self._start_worker(index)
+
+    def supervise(self) -> None:
+        # Упавший процесс перезапускается со своими камерами, остальные не затрагиваются
+        now = time.monotonic()
+        for index, process in enumerate(self._processes):
+            if self._stop_event.is_set():
+                return
+
+            if process is not None and not process.is_alive():
+                names = ", ".join(camera.name for camera in self._groups[index])
+                print(f"Процесс камер {names} завершился с кодом {process.exitcode}")
+                self._processes[index] = None
+                self._restart_at[index] = now + WORKER_RESTART_DELAY
+            elif process is None and now >= self._restart_at[index]:
+                self._start_worker(index)
+
+    def stop(self, timeout: float = WORKER_STOP_TIMEOUT) -> None:
+        # Общий срок на все процессы: зависший процесс не задерживает остановку
+        self._stop_event.set()
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            if process is not None:
+                process.join(max(deadline - time.monotonic(), 0))
+                if process.is_alive():
+                    # SIGTERM процессы камер игнорируют, поэтому kill
+                    print(f"Процесс {process.name} не завершился за {timeout:.0f} с, остановлен")
+                    process.kill()
+                    process.join()
+
+    def _start_worker(self, index: int) -> None:
+        group = self._groups[index]
+        process = self._context.Process(
+            target=_worker_main,
+            args=([camera.to_dict() for camera in group], self._stop_event, self._stats_interval),
+            name=f"cameras-{index}",
+            daemon=False,
+        )
+        process.start()
+        self._processes[index] = process